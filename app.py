@@ -1,269 +1,2626 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+import time
+# 모듈 로드(워커 부팅) 단계별 소요 시간 측정 시작 시각
+_startup_started = time.perf_counter()
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for
+import click
 import os
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.cache_handler import CacheHandler
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+import unicodedata
 import numpy as np
 import json  # JSON 파일 처리를 위해 추가
+from dataclasses import dataclass
+from enum import IntEnum
+from types import MappingProxyType, SimpleNamespace
+from typing import Mapping, Optional
+import hashlib
+import bisect
+import tempfile
+import zlib
+from collections import OrderedDict
+import sqlite3
+import threading
+import uuid
+from urllib.parse import urlencode
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import multiprocessing
+import queue
+try:
+    import fcntl
+except ImportError:  # Windows에는 fcntl이 없음 (프로세스 간 토큰 갱신 잠금 없이 동작)
+    fcntl = None
+
+# 가사 가져오기 라이브러리 (감성 분석용 VADER는 첫 사용 시 불러옴)
+import lyricsgenius
+from bs4 import BeautifulSoup  # lyricsgenius가 가사 페이지 파싱에 쓰는 의존성
+
+# .env 파일의 환경 변수 로드
+load_dotenv()
+
+app = Flask(__name__)
+
+#############################################
+# 시작 단계별 소요 시간
+#############################################
+
+# 단계 이름 → 직전 단계 이후 소요 시간(ms), /stats와 시작 로그로 확인
+STARTUP_PHASES = {}
+_startup_mark = _startup_started
+
+def mark_startup_phase(name):
+    """모듈 로드 중 한 단계가 끝났음을 기록"""
+    global _startup_mark
+    now = time.perf_counter()
+    STARTUP_PHASES[name] = round((now - _startup_mark) * 1000, 1)
+    _startup_mark = now
+
+mark_startup_phase("imports")
+
+#############################################
+# 운영 지표 (Prometheus 텍스트 형식 /metrics)
+#############################################
+
+# 워커별 지표 스냅샷 파일을 둘 디렉터리 (모든 gunicorn 워커가 같은 디렉터리를 공유, gunicorn.conf.py가 시작 시 비움)
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "music-taste-metrics"))
+# 워커가 스냅샷 파일을 다시 쓰는 주기(초), /metrics는 최대 이 시간만큼 늦은 다른 워커의 값을 보여줌
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# 지연 시간 히스토그램 구간 경계(초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 지표 이름 → (종류, 설명)
+METRIC_HELP = {
+    "http_request_duration_seconds": ("histogram", "엔드포인트별 요청 처리 시간"),
+    "upstream_request_duration_seconds": ("histogram", "외부 API 호출 시간 (HTTP 재시도 포함)"),
+    "classification_stage_duration_seconds": ("histogram", "분류 파이프라인 단계별 소요 시간"),
+    "sentiment_scoring_duration_seconds": ("histogram", "가사 한 곡의 감성 점수 계산 시간"),
+    "cache_requests_total": ("counter", "캐시 조회 수"),
+    "upstream_errors_total": ("counter", "실패한 외부 API 호출 수 (5xx, 429, 타임아웃, 연결 오류)"),
+    "upstream_client_errors_total": ("counter", "잘못된 요청으로 거절된 외부 API 호출 수 (400, 404)"),
+    "upstream_rejections_total": ("counter", "회로 차단기가 열려 거절된 외부 API 호출 수"),
+    "upstream_retries_total": ("counter", "외부 API HTTP 재시도 횟수"),
+    "artist_prewarm_skipped_total": ("counter", "호출 예산을 넘어 건너뛴 아티스트 인기곡 미리 채우기 수"),
+}
+
+def escape_label_value(value):
+    """Prometheus 라벨 값 이스케이프 (역슬래시, 줄바꿈, 큰따옴표)"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def process_alive(pid):
+    """같은 호스트에서 pid 프로세스가 살아 있는지 확인"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MetricsRegistry:
+    """
+    프로세스별 카운터/히스토그램 저장소.
+    gunicorn 워커마다 값을 따로 모으고 METRICS_DIR/metrics-<pid>.json 스냅샷 파일로 주기적으로 기록하며,
+    /metrics는 살아 있는 워커의 스냅샷만 합산해 응답합니다. 종료된 워커의 파일은 마스터(child_exit)가 지우고,
+    지우지 못한 파일도 합산에서 빠지므로 워커가 재시작되면 합계 카운터가 줄어들 수 있습니다 (Prometheus는 이를 카운터 초기화로 처리).
+    """
+
+    def __init__(self, metrics_dir, buckets):
+        self.metrics_dir = metrics_dir
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # 구간별(누적 아님) 관측 수 + 합계
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    @contextmanager
+    def time(self, name, **labels):
+        """with 블록의 실행 시간을 히스토그램에 기록"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+            }
+
+    def flush(self):
+        """현재 프로세스의 스냅샷 파일을 원자적으로 교체"""
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            path = os.path.join(self.metrics_dir, f"metrics-{os.getpid()}.json")
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            app.logger.exception("지표 스냅샷 저장 실패")
+
+    def reset(self):
+        """fork된 자식에서 부모가 모은 값과 잠금을 버리고 새로 시작"""
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def collect(self):
+        """모든 워커의 스냅샷을 합산해 ({카운터 키: 값}, {히스토그램 키: [구간별 수, 합계]})로 반환"""
+        self.flush()
+        counters = {}
+        histograms = {}
+        try:
+            names = os.listdir(self.metrics_dir)
+        except OSError:
+            names = []
+        for file_name in names:
+            if not (file_name.startswith("metrics-") and file_name.endswith(".json")):
+                continue
+            pid = file_name[len("metrics-"):-len(".json")]
+            # 마스터가 지우기 전에 죽은(SIGKILL 등) 워커의 파일은 합산하지 않음
+            if not pid.isdigit() or not process_alive(int(pid)):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, file_name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms
+
+    def render(self):
+        """Prometheus 텍스트 노출 형식(0.0.4) 문자열"""
+        counters, histograms = self.collect()
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + "}"
+
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (series, labels), value in sorted(counters.items()):
+                    if series == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for (series, labels), (counts, total) in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry(METRICS_DIR, LATENCY_BUCKETS)
+_metrics_flusher = None
+
+def start_metrics_flusher():
+    """요청이 없는 워커의 값도 /metrics에 반영되도록 스냅샷 파일을 주기적으로 기록하는 스레드 시작"""
+    global _metrics_flusher
+
+    def flush_loop():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            metrics.flush()
+
+    if _metrics_flusher is None or not _metrics_flusher.is_alive():
+        _metrics_flusher = threading.Thread(target=flush_loop, name="metrics-flusher", daemon=True)
+        _metrics_flusher.start()
+
+# 환경 변수에서 Spotify 클라이언트 ID, Secret, Genius 토큰 가져오기
+client_id = os.getenv("SPOTIPY_CLIENT_ID")
+client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
+genius_token = os.getenv("GENIUS_ACCESS_TOKEN")
+
+#############################################
+# 외부 API용 HTTP 연결 풀
+#############################################
+
+# 호스트별 최대 유지 연결 수 (워커 프로세스 안에서 동시에 외부 API를 호출하는 스레드 수 이상으로 설정)
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+# 연결 풀을 만들어 둘 호스트 수
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+# 연결 수립 / 응답 대기 타임아웃(초)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+# 연결 오류, 429, 5xx 응답 재시도 횟수와 지수 백오프 계수 (429는 Retry-After 헤더를 따름)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """타임아웃 없이 호출된 요청에도 기본 (연결, 응답) 타임아웃을 적용하는 어댑터"""
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else HTTP_TIMEOUT, **kwargs)
+
+class CountingRetry(Retry):
+    """재시도할 때마다 호스트별 재시도 횟수를 지표에 기록하는 urllib3 재시도 정책"""
+
+    def increment(self, *args, **kwargs):
+        metrics.inc("upstream_retries_total", host=getattr(kwargs.get("_pool"), "host", "unknown"))
+        return super().increment(*args, **kwargs)
+
+def build_http_session():
+    """keep-alive 연결을 재사용하고 재시도/백오프 정책이 적용된 requests 세션을 생성"""
+    retry = CountingRetry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def http_pool_stats(session):
+    """세션의 호스트별 연결 풀 사용량 (새로 연결한 횟수 = TLS 핸드셰이크 수, 처리한 요청 수, 유휴 연결 수)"""
+    stats = {}
+    for adapter in dict.fromkeys(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_created": pool.num_connections,
+                "requests": pool.num_requests,
+                # 풀의 빈 자리는 None으로 채워져 있으므로 실제로 열려 있는 유휴 연결만 셈
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                "maxsize": HTTP_POOL_MAXSIZE,
+            }
+    return stats
+
+#############################################
+# Genius 호출 속도 제한 (토큰 버킷)
+#############################################
+
+# Genius 호출 허용 속도(초당 요청 수)와 순간 최대 허용량
+# 워커 프로세스마다 별도의 버킷을 가지므로 전체 허용량은 워커 수 × GENIUS_RATE_LIMIT
+GENIUS_RATE_LIMIT = float(os.getenv("GENIUS_RATE_LIMIT", "5"))
+GENIUS_RATE_BURST = int(os.getenv("GENIUS_RATE_BURST", "10"))
+
+class TokenBucket:
+    """
+    스레드 간에 공유하는 토큰 버킷 속도 제한기.
+    초당 rate개씩 최대 burst개까지 토큰이 쌓이며, 토큰이 남아 있으면 기다리지 않고 바로 통과합니다.
+    토큰이 부족하면 미리 예약한 뒤 차례가 올 때까지 잠금 밖에서 기다리므로 호출 순서대로 공정하게 통과합니다.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def thread_wait_seconds(self):
+        """현재 스레드가 지금까지 토큰을 기다린 누적 시간(초) (외부 호출 시간에서 대기 시간을 빼는 데 사용)"""
+        return getattr(self._local, "wait_seconds", 0.0)
+
+    def acquire(self):
+        """토큰 하나를 사용, 필요한 만큼만 대기"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += 1
+            if delay:
+                self.waited += 1
+                self.wait_seconds += delay
+        if delay:
+            time.sleep(delay)
+            self._local.wait_seconds = self.thread_wait_seconds() + delay
+
+    def try_acquire(self):
+        """토큰이 남아 있으면 하나를 사용하고 True, 없으면 기다리지 않고 False를 반환"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.acquired += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_seconds": self.wait_seconds,
+            }
+
+genius_rate_limiter = TokenBucket(GENIUS_RATE_LIMIT, GENIUS_RATE_BURST)
+
+class RateLimitedGenius(lyricsgenius.Genius):
+    """
+    lyricsgenius는 요청마다 무조건 max(_SLEEP_MIN, sleep_time)초를 쉬므로,
+    고정 대기를 없애고 API/웹 검색/가사 페이지 요청 직전에 공용 토큰 버킷에서 토큰을 받도록 바꾼 클라이언트.
+    lyricsgenius는 웹 검색과 가사 페이지를 모듈의 requests.get으로 직접 호출하고 가사 페이지에는 타임아웃도 없으므로,
+    두 요청은 여기서 web_session(연결 풀과 기본 타임아웃이 적용된 세션)으로 보냅니다.
+    """
+
+    _SLEEP_MIN = 0
+    # 웹 검색/가사 페이지 요청에 쓸 세션 (requests 모듈과 같은 get 인터페이스)
+    web_session = requests
+
+    def _make_request(self, path, method='GET', params_=None):
+        genius_rate_limiter.acquire()
+        return super()._make_request(path, method=method, params_=params_)
+
+    def search_genius_web(self, search_term, per_page=5):
+        genius_rate_limiter.acquire()
+        # API가 아닌 웹 검색 엔드포인트 (lyricsgenius 2.0.1과 같은 요청)
+        url = "https://genius.com/api/search/multi?" + urlencode({'per_page': per_page, 'q': search_term})
+        response = self.web_session.get(url, timeout=self.timeout)
+        return response.json()['response'] if response else None
+
+    def _scrape_song_lyrics_from_url(self, url):
+        genius_rate_limiter.acquire()
+        page = self.web_session.get(url, timeout=self.timeout)
+        if page.status_code == 404:
+            return None
+        # lyricsgenius는 5xx 페이지도 파싱해 "가사 없음"(None)으로 돌려주므로, 장애 응답은 예외로 올려
+        # 가사 없음으로 캐시되지 않고 회로 차단기의 실패와 가사 점수 대체(fallback)로 처리되게 함
+        if page.status_code != 200:
+            raise requests.HTTPError(f"Genius 가사 페이지 응답 {page.status_code}: {url}", response=page)
+        return self._lyrics_from_html(page.text)
+
+    def _lyrics_from_html(self, text):
+        """가사 페이지 HTML에서 가사 본문을 추출 (lyricsgenius 2.0.1과 같은 규칙, 가사 영역이 없으면 None)"""
+        html = BeautifulSoup(text, "html.parser")
+        old_div = html.find("div", class_="lyrics")
+        if old_div:
+            lyrics = old_div.get_text()
+        else:
+            new_div = html.find("div", class_=re.compile("Lyrics__Root"))
+            if not new_div:
+                return None
+            lyrics = new_div.get_text('\n').replace('\n[', '\n\n[')
+        if self.remove_section_headers:
+            lyrics = re.sub(r'(\[.*?\])*', '', lyrics)
+            lyrics = re.sub('\n{2}', '\n', lyrics)
+        return lyrics.strip("\n")
+
+# Spotify API(토큰 발급 포함), Genius API, Genius 웹(검색/가사 페이지)용 세션
+spotify_session = build_http_session()
+genius_api_session = build_http_session()
+genius_web_session = build_http_session()
+
+#############################################
+# 워커 간 공유 Spotify 토큰 캐시
+#############################################
+
+# 같은 호스트의 모든 워커가 함께 쓰는 토큰 파일 경로 (같은 경로에 .lock 파일을 만들어 갱신을 직렬화)
+SPOTIFY_TOKEN_CACHE_PATH = os.getenv(
+    "SPOTIFY_TOKEN_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".spotify_token_cache")
+)
+# 만료까지 이 시간(초)보다 적게 남으면 백그라운드에서 미리 갱신, 확인 주기(초)
+SPOTIFY_TOKEN_REFRESH_MARGIN = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
+SPOTIFY_TOKEN_CHECK_INTERVAL = int(os.getenv("SPOTIFY_TOKEN_CHECK_INTERVAL", "30"))
+
+class SharedFileTokenCache(CacheHandler):
+    """
+    여러 워커 프로세스가 함께 쓰는 파일 기반 토큰 캐시.
+    파일은 임시 파일에 쓴 뒤 교체하므로 잠금 없이 읽어도 항상 온전한 토큰을 보며,
+    갱신은 locked()로 프로세스 간 배타 잠금(fcntl.flock)을 잡은 상태에서만 수행합니다.
+    fcntl이 없는 환경(Windows 개발 환경)에서는 프로세스 안의 스레드끼리만 직렬화합니다.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.refreshes = 0
+        self._token_info = None
+        self._thread_lock = threading.Lock()
+
+    def get_cached_token(self):
+        # 메모리에 있는 토큰이 곧 만료되지 않으면 파일을 다시 읽지 않음
+        token_info = self._token_info
+        if token_info and token_info.get("expires_at", 0) - time.time() > SPOTIFY_TOKEN_REFRESH_MARGIN:
+            return token_info
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._token_info = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            app.logger.warning(f"Spotify 토큰 캐시 읽기 실패: {e}")
+        return self._token_info
+
+    def save_token_to_cache(self, token_info):
+        self._token_info = token_info
+        self.refreshes += 1
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(token_info, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            app.logger.warning(f"Spotify 토큰 캐시 저장 실패: {e}")
+
+    @contextmanager
+    def locked(self):
+        """토큰 갱신 구간을 모든 워커에서 하나씩만 실행하도록 잠금"""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class SharedClientCredentials(SpotifyClientCredentials):
+    """
+    토큰 발급을 워커 간에 공유하는 Client Credentials 인증.
+    캐시된 토큰이 유효하면 잠금 없이 바로 쓰고, 발급이 필요하면 잠금을 잡은 뒤 캐시를 다시 확인해
+    다른 워커가 이미 발급한 토큰이 있으면 그것을 사용합니다.
+    """
+
+    def get_access_token(self, as_dict=True, check_cache=True):
+        token_info = self.cache_handler.get_cached_token()
+        if check_cache and token_info and not self.is_token_expired(token_info):
+            return token_info if as_dict else token_info["access_token"]
+        with self.cache_handler.locked():
+            return super().get_access_token(as_dict=as_dict, check_cache=check_cache)
+
+    def refresh_if_expiring(self, margin):
+        """토큰이 없거나 margin초 안에 만료되면 새로 발급 (잠금 안에서 다시 확인해 워커 하나만 발급)"""
+        def expiring():
+            token_info = self.cache_handler.get_cached_token()
+            return not token_info or token_info.get("expires_at", 0) - time.time() <= margin
+
+        if not expiring():
+            return False
+        with self.cache_handler.locked():
+            if not expiring():
+                return False
+            super().get_access_token(as_dict=False, check_cache=False)
+            return True
+
+_token_refresher = None
+
+def start_token_refresher():
+    """토큰이 만료되기 전에 백그라운드에서 미리 갱신하는 스레드를 시작 (사용자 요청이 토큰 발급을 기다리지 않도록)"""
+    global _token_refresher
+
+    def refresh_loop():
+        while True:
+            try:
+                if client_credentials_manager.refresh_if_expiring(SPOTIFY_TOKEN_REFRESH_MARGIN):
+                    app.logger.info("Spotify 액세스 토큰 갱신 완료")
+            except Exception as e:
+                app.logger.exception("Spotify 액세스 토큰 갱신 실패")
+            time.sleep(SPOTIFY_TOKEN_CHECK_INTERVAL)
+
+    if _token_refresher is None or not _token_refresher.is_alive():
+        _token_refresher = threading.Thread(target=refresh_loop, name="spotify-token-refresher", daemon=True)
+        _token_refresher.start()
+
+# Spotify Client Credentials Flow 설정 (토큰은 워커 간 공유 파일 캐시에 보관)
+spotify_token_cache = SharedFileTokenCache(SPOTIFY_TOKEN_CACHE_PATH)
+client_credentials_manager = SharedClientCredentials(
+    client_id=client_id, client_secret=client_secret, cache_handler=spotify_token_cache,
+    requests_session=spotify_session, requests_timeout=HTTP_TIMEOUT
+)
+# 재시도는 세션 어댑터가 담당하므로 spotipy 자체 재시도는 끔
+sp = spotipy.Spotify(
+    client_credentials_manager=client_credentials_manager,
+    requests_session=spotify_session, requests_timeout=HTTP_TIMEOUT,
+    retries=0, status_retries=0
+)
+
+# Genius 객체 생성 (lyricsgenius 사용)
+# 속도 제한은 토큰 버킷이 담당하므로 요청 후 고정 대기(sleep_time)는 두지 않음
+genius = RateLimitedGenius(
+    genius_token, skip_non_songs=True, excluded_terms=["(Remix)", "(Live)"], timeout=HTTP_TIMEOUT, sleep_time=0
+)
+# lyricsgenius는 클래스 전체가 공유하는 기본 세션을 쓰므로 헤더(인증 포함)를 옮긴 전용 세션으로 교체
+genius_api_session.headers.update(genius._session.headers)
+genius._session = genius_api_session
+# 웹 검색과 가사 페이지는 풀링된 전용 세션으로 보내 연결을 재사용하고 타임아웃을 적용
+genius.web_session = genius_web_session
+
+mark_startup_phase("clients")
+
+# 로깅 설정
+logging.basicConfig(level=logging.DEBUG)
+
+#############################################
+# VADER 감성 분석기 (첫 사용 시 로드)
+#############################################
+
+# 미리 받아 둔 VADER 사전 경로: vader_lexicon.txt 파일 또는 nltk_data 디렉터리
+# 지정하지 않으면 앱 폴더의 nltk_data와 NLTK 기본 경로(NLTK_DATA 등)에서 찾음
+VADER_LEXICON_PATH = os.getenv("VADER_LEXICON_PATH", "")
+# 사전을 찾지 못했을 때 nltk.download로 받아올지 (개발 환경에서만 1로 켜고, 배포 시에는 nltk.txt로 사전을 미리 준비)
+VADER_AUTO_DOWNLOAD = os.getenv("VADER_AUTO_DOWNLOAD", "0") == "1"
+BUNDLED_NLTK_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+_sentiment_analyzer = None
+_sentiment_analyzer_lock = threading.Lock()
+
+def load_sentiment_analyzer():
+    """로컬 경로의 사전으로 VADER 분석기를 생성 (네트워크 확인 없음, 사전이 없을 때만 설정에 따라 내려받음)"""
+    # nltk는 가져오는 데만 수백 ms가 걸리므로 부팅 시가 아니라 첫 가사 분석 때 불러옴
+    import nltk
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+    
+    if BUNDLED_NLTK_DATA not in nltk.data.path:
+        nltk.data.path.insert(0, BUNDLED_NLTK_DATA)
+    if VADER_LEXICON_PATH:
+        path = os.path.abspath(VADER_LEXICON_PATH)
+        if os.path.isfile(path):
+            # 파일이 있는 디렉터리를 검색 경로에 넣고 파일 이름으로 불러옴
+            nltk.data.path.insert(0, os.path.dirname(path))
+            return SentimentIntensityAnalyzer(lexicon_file=os.path.basename(path))
+        nltk.data.path.insert(0, path)
+    try:
+        return SentimentIntensityAnalyzer()
+    except LookupError:
+        if not VADER_AUTO_DOWNLOAD:
+            raise RuntimeError(
+                "VADER 사전(vader_lexicon)을 찾을 수 없습니다. 배포 시 nltk.txt로 내려받거나 "
+                "`python -m nltk.downloader -d nltk_data vader_lexicon`으로 준비하거나 VADER_LEXICON_PATH를 지정하세요."
+            ) from None
+        app.logger.warning("VADER 사전을 찾지 못해 내려받습니다. (VADER_LEXICON_PATH 또는 nltk_data 준비 권장)")
+        nltk.download('vader_lexicon', quiet=True)
+        return SentimentIntensityAnalyzer()
+
+def get_sentiment_analyzer():
+    """프로세스 공용 VADER 분석기 (처음 호출될 때 한 번만 생성)"""
+    global _sentiment_analyzer
+    if _sentiment_analyzer is None:
+        with _sentiment_analyzer_lock:
+            if _sentiment_analyzer is None:
+                _sentiment_analyzer = load_sentiment_analyzer()
+    return _sentiment_analyzer
+
+def require_sentiment_lexicon():
+    """
+    서버 시작 시 VADER 사전을 불러 봅니다. 사전이 없으면 예외를 그대로 올려 부팅을 멈추므로,
+    사전 없이 떠서 모든 가사 점수가 중립값으로 대체되는 상황을 배포 단계에서 바로 알 수 있습니다.
+    """
+    try:
+        get_sentiment_engine()
+    except Exception as e:
+        app.logger.critical(f"VADER 사전을 불러오지 못해 서버를 시작할 수 없습니다: {e}")
+        raise
+
+#############################################
+# 가사 전용 고속 VADER 감성 엔진
+#############################################
+
+# 토큰 정보 표를 비우기 전까지 보관할 최대 토큰 수
+SENTIMENT_TOKEN_TABLE_SIZE = int(os.getenv("SENTIMENT_TOKEN_TABLE_SIZE", "200000"))
+# 가사의 구간 표시 줄 ([Chorus], [Verse 1: 아티스트] 등)
+SECTION_MARKER_PATTERN = re.compile(r"^\s*\[[^\]]*\]\s*$")
+
+class LyricsSentimentEngine:
+    """
+    NLTK SentimentIntensityAnalyzer와 같은 compound 점수를 가사에 맞게 빠르게 계산하는 엔진.
+
+    VADER는 토큰마다 "그 토큰이 처음 나온 위치"의 문맥으로 점수를 매기므로, 반복되는 후렴 줄은
+    처음 나온 위치의 점수를 그대로 다시 쓰게 됩니다. 이를 이용해
+    - 서로 다른 줄만 한 번씩 토큰화하고,
+    - 감성 사전에 있는 서로 다른 토큰만 NLTK의 sentiment_valence로 점수를 계산하며,
+    - 토큰별 소문자/사전 포함 여부/부스터 여부/대문자 여부를 프로세스 공용 표에 캐시합니다.
+    NLTK가 텍스트마다 (구두점 × 단어) 조합 사전을 만드는 단계는 줄 단위 구두점 확인으로 대체합니다.
+    점수 합계는 NLTK와 똑같이 전체 토큰 순서대로 더합니다. 줄별 합계 × 등장 횟수로 더하면 부동소수점 덧셈 순서가
+    달라져 0에 가까운 합계의 부호가 뒤집히고, 느낌표 강조가 반대 방향으로 붙을 수 있기 때문입니다.
+
+    strip_sections=False이면 NLTK의 polarity_scores(text)["compound"]와 반올림 오차(1e-4) 이내로 같고,
+    strip_sections=True(기본)이면 구간 표시 줄을 빼고 계산하므로 원문 기준 점수와 약간 달라질 수 있습니다.
+    """
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.lexicon = analyzer.lexicon
+        constants = analyzer.constants
+        self.boosters = constants.BOOSTER_DICT
+        self.punc_list = tuple(sorted(constants.PUNC_LIST, key=len, reverse=True))
+        self.punc_chars = frozenset("".join(constants.PUNC_LIST))
+        self.remove_punctuation = constants.REGEX_REMOVE_PUNCTUATION
+        self.normalize = constants.normalize
+        # 토큰 → (소문자, 감성 사전 포함 여부, 부스터 여부, 모두 대문자인지)
+        self._token_table = {}
+
+    def _token_info(self, token):
+        info = self._token_table.get(token)
+        if info is None:
+            lower = token.lower()
+            info = (lower, lower in self.lexicon, lower in self.boosters, token.isupper())
+            if len(self._token_table) >= SENTIMENT_TOKEN_TABLE_SIZE:
+                self._token_table.clear()
+            self._token_table[token] = info
+        return info
+
+    def _strip_token_punctuation(self, token, words_only):
+        """NLTK SentiText와 같은 규칙으로 앞뒤 구두점 하나(PUNC_LIST)를 떼어냄 (남은 단어가 본문 단어일 때만)"""
+        if token[-1] in self.punc_chars:
+            for punc in self.punc_list:
+                if token.endswith(punc) and token[:-len(punc)] in words_only:
+                    return token[:-len(punc)]
+        if token[0] in self.punc_chars:
+            for punc in self.punc_list:
+                if token.startswith(punc) and token[len(punc):] in words_only:
+                    return token[len(punc):]
+        return token
+
+    def compound(self, text, strip_sections=True):
+        """텍스트 하나의 VADER compound 점수 (-1 ~ 1, 소수 넷째 자리 반올림)"""
+        # 1. 줄 단위로 나누고 같은 줄은 한 번만 토큰화 (등장 순서와 횟수는 따로 기록)
+        line_ids = {}
+        occurrences = []
+        for line in text.split("\n"):
+            if strip_sections and SECTION_MARKER_PATTERN.match(line):
+                continue
+            occurrences.append(line_ids.setdefault(line, len(line_ids)))
+        lines = list(line_ids)
+        raw_tokens = [[token for token in line.split() if len(token) > 1] for line in lines]
+        words_only = set()
+        for line in lines:
+            words_only.update(word for word in self.remove_punctuation.sub("", line).split() if len(word) > 1)
+        line_tokens = [
+            [self._strip_token_punctuation(token, words_only) if token[0] in self.punc_chars or token[-1] in self.punc_chars
+             else token for token in tokens]
+            for tokens in raw_tokens
+        ]
+        
+        # 2. 전체 토큰 순서를 복원하고 토큰별 첫 등장 위치, 대문자 토큰 수, 첫 "but" 위치를 구함
+        tokens = []
+        first_index = {}
+        seen_lines = set()
+        for line_id in occurrences:
+            if line_id not in seen_lines:
+                seen_lines.add(line_id)
+                for position, token in enumerate(line_tokens[line_id], len(tokens)):
+                    first_index.setdefault(token, position)
+            tokens.extend(line_tokens[line_id])
+        if not tokens:
+            return 0.0
+        infos = {token: self._token_info(token) for token in first_index}
+        allcaps = sum(1 for token in tokens if infos[token][3])
+        is_cap_diff = 0 < len(tokens) - allcaps < len(tokens)
+        but_index = next((i for i, token in enumerate(tokens) if infos[token][0] == "but"), None)
+        
+        # 3. 감성 사전에 있는 서로 다른 토큰만 첫 등장 위치의 문맥으로 점수 계산 (NLTK 규칙 그대로 사용)
+        sentitext = SimpleNamespace(words_and_emoticons=tokens, is_cap_diff=is_cap_diff)
+        valences = {}
+        for token, i in first_index.items():
+            lower, in_lexicon, is_booster, _ = infos[token]
+            if not in_lexicon or is_booster or (
+                lower == "kind" and i < len(tokens) - 1 and infos[tokens[i + 1]][0] == "of"
+            ):
+                continue
+            valences[token] = self.analyzer.sentiment_valence(0, sentitext, token, i, [])[0]
+        
+        # 4. 토큰 순서대로 점수를 모아 NLTK와 같은 순서로 합산 ("but" 앞의 토큰은 0.5배, 뒤의 토큰은 1.5배)
+        sentiments = [valences.get(token, 0) for token in tokens]
+        if but_index is not None:
+            sentiments = [
+                valence * 0.5 if position < but_index else valence * 1.5 if position > but_index else valence
+                for position, valence in enumerate(sentiments)
+            ]
+        sum_s = float(sum(sentiments))
+        
+        # 5. 느낌표/물음표 강조 후 정규화 (NLTK score_valence와 같은 규칙)
+        ep_count = min(4, sum(lines[line_id].count("!") for line_id in occurrences))
+        qm_count = sum(lines[line_id].count("?") for line_id in occurrences)
+        punct_amplifier = ep_count * 0.292 + (0 if qm_count <= 1 else qm_count * 0.18 if qm_count <= 3 else 0.96)
+        if sum_s > 0:
+            sum_s += punct_amplifier
+        elif sum_s < 0:
+            sum_s -= punct_amplifier
+        return round(self.normalize(sum_s), 4)
+
+    def compound_many(self, texts, strip_sections=True):
+        """여러 가사의 compound 점수를 입력 순서대로 반환 (같은 텍스트는 한 번만 계산)"""
+        scores = {}
+        for text in texts:
+            if text not in scores:
+                scores[text] = self.compound(text, strip_sections=strip_sections)
+        return [scores[text] for text in texts]
+
+_sentiment_engine = None
+
+def get_sentiment_engine():
+    """프로세스 공용 가사 감성 엔진 (VADER 사전을 불러온 분석기를 감쌈)"""
+    global _sentiment_engine
+    if _sentiment_engine is None:
+        analyzer = get_sentiment_analyzer()
+        with _sentiment_analyzer_lock:
+            if _sentiment_engine is None:
+                _sentiment_engine = LyricsSentimentEngine(analyzer)
+    return _sentiment_engine
+
+#############################################
+# 분류 그룹
+#############################################
+
+# 그룹 이름 (가중치 배열의 열 순서이자 응답 딕셔너리의 키 순서)
+GROUP_NAMES = ("칠 가이", "미식가", "BGM 마스터", "클러버", "사운드 실험가", "클래식 수호자")
+
+class Group(IntEnum):
+    """분류 그룹. 값은 점수 모델 배열의 열 번호입니다."""
+    CHILL_GUY = 0
+    GOURMET = 1
+    BGM_MASTER = 2
+    CLUBBER = 3
+    SOUND_EXPLORER = 4
+    CLASSIC_GUARDIAN = 5
+
+    @property
+    def label(self):
+        return GROUP_NAMES[self]
+
+GROUP_INDEX = {group.label: group for group in Group}
+
+#############################################
+# DECADE_GROUP_WEIGHTS: 발매 연도(데케이드)별 음악적 트렌드를 반영하는 가중치
+#############################################
+# 개선된 DECADE_GROUP_WEIGHTS 예시
+
+DECADE_GROUP_WEIGHTS = {
+    "1960s": {
+        Group.CHILL_GUY: 0.25,       # 차분하고 전통적인 느낌
+        Group.GOURMET: 0.25,       # 섬세한 음악 감상
+        Group.BGM_MASTER: 0.15,   # 배경 음악으로 적합
+        Group.CLUBBER: 0.05,       # 클럽 분위기는 거의 없음
+        Group.SOUND_EXPLORER: 0.05, # 실험적 요소는 미미함
+        Group.CLASSIC_GUARDIAN: 0.25  # 클래식과 전통적 가치 강조
+    },
+    "1970s": {
+        Group.CHILL_GUY: 0.20,
+        Group.GOURMET: 0.20,
+        Group.BGM_MASTER: 0.15,
+        Group.CLUBBER: 0.20,       # 디스코와 펑크의 등장으로 댄스 분위기 상승
+        Group.SOUND_EXPLORER: 0.10,
+        Group.CLASSIC_GUARDIAN: 0.15
+    },
+    "1980s": {
+        Group.CHILL_GUY: 0.20,
+        Group.GOURMET: 0.20,
+        Group.BGM_MASTER: 0.15,
+        Group.CLUBBER: 0.25,       # 신스팝, 전자음악의 부상 → 댄스/클럽 분위기 강화
+        Group.SOUND_EXPLORER: 0.10,
+        Group.CLASSIC_GUARDIAN: 0.10
+    },
+    "1990s": {
+        Group.CHILL_GUY: 0.25,
+        Group.GOURMET: 0.15,
+        Group.BGM_MASTER: 0.15,
+        Group.CLUBBER: 0.25,       # 얼터너티브, 힙합 등으로 클럽 분위기와 에너지 상승
+        Group.SOUND_EXPLORER: 0.10,
+        Group.CLASSIC_GUARDIAN: 0.10
+    },
+    "2000s": {
+        Group.CHILL_GUY: 0.30,
+        Group.GOURMET: 0.20,
+        Group.BGM_MASTER: 0.10,
+        Group.CLUBBER: 0.20,
+        Group.SOUND_EXPLORER: 0.10,
+        Group.CLASSIC_GUARDIAN: 0.10
+    },
+    "2010s": {
+        Group.CHILL_GUY: 0.25,
+        Group.GOURMET: 0.20,
+        Group.BGM_MASTER: 0.10,
+        Group.CLUBBER: 0.30,       # EDM과 클럽 문화의 영향
+        Group.SOUND_EXPLORER: 0.10,
+        Group.CLASSIC_GUARDIAN: 0.05
+    },
+    "2020s": {
+        Group.CHILL_GUY: 0.25,
+        Group.GOURMET: 0.20,
+        Group.BGM_MASTER: 0.10,
+        Group.CLUBBER: 0.25,
+        Group.SOUND_EXPLORER: 0.15,  # 다양한 실험적 음악의 부상
+        Group.CLASSIC_GUARDIAN: 0.05
+    }
+}
+
+# genre_seeds.json을 불러오지 못했을 때 사용하는 기본 장르 가중치
+FALLBACK_GENRE_GROUP_WEIGHTS = {
+    "indie": {Group.CHILL_GUY: 0.3, Group.GOURMET: 0.7, Group.BGM_MASTER: 0.4},
+    "indie pop": {Group.CHILL_GUY: 0.4, Group.GOURMET: 0.6, Group.BGM_MASTER: 0.4},
+    "alternative": {Group.GOURMET: 0.4, Group.BGM_MASTER: 0.6, Group.CLUBBER: 0.2},
+    "experimental": {Group.SOUND_EXPLORER: 0.9, Group.GOURMET: 0.1, Group.CHILL_GUY: 0.1},
+    "lo-fi": {Group.CHILL_GUY: 0.8, Group.BGM_MASTER: 0.4, Group.GOURMET: 0.2},
+    "ambient": {Group.CHILL_GUY: 0.8, Group.BGM_MASTER: 0.5},
+    "pop": {Group.BGM_MASTER: 0.5, Group.CLUBBER: 0.3, Group.GOURMET: 0.2},
+    "hip hop": {Group.CLUBBER: 0.7, Group.SOUND_EXPLORER: 0.2},
+    "rap": {Group.CLUBBER: 0.7, Group.SOUND_EXPLORER: 0.2},
+    "rock": {Group.CLUBBER: 0.6, Group.GOURMET: 0.3, Group.BGM_MASTER: 0.2},
+}
+
+# 이름만 있고 가중치가 없는 장르 시드 항목에 적용하는 기본 가중치
+DEFAULT_SEED_WEIGHTS = {
+    Group.GOURMET: 0.5,
+    Group.CHILL_GUY: 0.5,
+    Group.BGM_MASTER: 0.3,
+    Group.CLUBBER: 0.3,
+    Group.SOUND_EXPLORER: 0.3,
+    Group.CLASSIC_GUARDIAN: 0.3
+}
+
+#############################################
+# 장르 시드 로드 및 점수 모델
+#############################################
+
+GENRE_SEEDS_PATH = os.getenv("GENRE_SEEDS_PATH", "genre_seeds.json")
+# genre_seeds.json 변경 여부(mtime)를 확인하는 최소 간격(초)
+SCORING_MODEL_RELOAD_INTERVAL = float(os.getenv("SCORING_MODEL_RELOAD_INTERVAL", "5"))
+
+def normalize_genre(genre):
+    """장르 문자열의 앞뒤 공백 제거 및 소문자화"""
+    if not isinstance(genre, str):
+        return ""
+    return genre.strip().lower()
+
+def parse_genre_seeds(data):
+    """
+    genre_seeds.json 내용에서 장르별 그룹 가중치와 템포 기대치(BPM)를 한 번에 추출합니다.
+    이름만 있는 항목은 기본 가중치를 사용하며 템포 기대치는 갖지 않습니다.
+    """
+    genre_weights = {}
+    tempo_expectations = {}
+    for item in data.get("genres", []):
+        if isinstance(item, dict):
+            name = normalize_genre(item.get("name", ""))
+            genre_weights[name] = {GROUP_INDEX[group]: weight for group, weight in item.get("weights", {}).items()}
+            # "tempo" 키가 있으면 가져오고, 없으면 기본값 100 BPM 사용
+            tempo_expectations[name] = item.get("tempo", 100)
+        else:
+            genre_weights[normalize_genre(item)] = dict(DEFAULT_SEED_WEIGHTS)
+    return genre_weights, tempo_expectations
+
+def _frozen_array(values, dtype=float):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+@dataclass(frozen=True)
+class ScoringModel:
+    """
+    장르 시드와 데케이드 가중치로부터 만든 읽기 전용 점수 모델.
+    장르 → 행 번호 인덱스, 장르×그룹 가중치 배열, 장르별 BPM 배열, 데케이드×그룹 가중치 배열을 가집니다.
+    """
+    genre_index: Mapping[str, int]
+    weights: np.ndarray
+    has_weights: np.ndarray
+    tempo: np.ndarray
+    has_tempo: np.ndarray
+    decade_index: Mapping[str, int]
+    decades: np.ndarray
+    version: str
+    source_mtime: Optional[float] = None
+
+    def decade_row(self, year):
+        """발매 연도에 해당하는 데케이드 행 번호 (정의되지 않은 데케이드는 2000s로 취급)"""
+        row = self.decade_index.get(f"{(year // 10) * 10}s")
+        return row if row is not None else self.decade_index["2000s"]
+
+    def score_genres(self, genre_lists):
+        """
+        여러 트랙의 장르 리스트를 한 번에 점수화합니다.
+        모든 장르를 행 번호로 바꿔 한 번에 모은(gather) 뒤, 트랙별 평균을 구합니다.
+        반환값: (트랙×그룹 평균 가중치 행렬, 트랙별 0~1 정규화 템포 벡터)
+        """
+        n_tracks = len(genre_lists)
+        rows = []
+        owners = []
+        for track, genres in enumerate(genre_lists):
+            for genre in genres:
+                row = self.genre_index.get(normalize_genre(genre))
+                if row is not None:
+                    rows.append(row)
+                    owners.append(track)
+        rows = np.array(rows, dtype=np.intp)
+        owners = np.array(owners, dtype=np.intp)
+
+        # 그룹 가중치: 가중치가 정의된 장르만 평균 (일치하는 장르가 없으면 0)
+        weighted = self.has_weights[rows]
+        weight_counts = np.bincount(owners[weighted], minlength=n_tracks)
+        weight_sums = np.zeros((n_tracks, len(Group)))
+        np.add.at(weight_sums, owners[weighted], self.weights[rows[weighted]])
+        group_scores = np.divide(weight_sums, weight_counts[:, None],
+                                 out=np.zeros_like(weight_sums), where=weight_counts[:, None] > 0)
+
+        # 템포: BPM이 정의된 장르만 평균한 뒤 60~140 BPM 범위를 0~1로 정규화 (없으면 0.5)
+        timed = self.has_tempo[rows]
+        tempo_counts = np.bincount(owners[timed], minlength=n_tracks)
+        tempo_sums = np.bincount(owners[timed], weights=self.tempo[rows[timed]], minlength=n_tracks)
+        tempo_scores = np.full(n_tracks, 0.5)
+        has_tempo = tempo_counts > 0
+        tempo_scores[has_tempo] = (tempo_sums[has_tempo] / tempo_counts[has_tempo] - 60) / (140 - 60)
+        return group_scores, tempo_scores
+
+def build_scoring_model(genre_weights, tempo_expectations, decade_weights, source_mtime=None):
+    """장르/템포/데케이드 가중치 매핑을 배열로 변환해 ScoringModel 생성"""
+    genres = list(dict.fromkeys([*genre_weights, *tempo_expectations]))
+    genre_index = {genre: i for i, genre in enumerate(genres)}
+    weights = np.zeros((len(genres), len(Group)))
+    has_weights = np.zeros(len(genres), dtype=bool)
+    tempo = np.zeros(len(genres))
+    has_tempo = np.zeros(len(genres), dtype=bool)
+    for genre, group_weights in genre_weights.items():
+        row = genre_index[genre]
+        has_weights[row] = True
+        for group, weight in group_weights.items():
+            weights[row, group] = weight
+    for genre, bpm in tempo_expectations.items():
+        row = genre_index[genre]
+        tempo[row] = bpm
+        has_tempo[row] = True
+    decade_index = {decade: i for i, decade in enumerate(decade_weights)}
+    decades = [[group_weights.get(group, 0) for group in Group] for group_weights in decade_weights.values()]
+
+    # 모델 내용이 같으면 같은 버전 (분류 결과 캐시 무효화에 사용)
+    version_source = json.dumps(
+        [{g: {int(k): v for k, v in w.items()} for g, w in genre_weights.items()}, tempo_expectations,
+         {d: {int(k): v for k, v in w.items()} for d, w in decade_weights.items()}],
+        sort_keys=True, ensure_ascii=False
+    )
+    return ScoringModel(
+        genre_index=MappingProxyType(genre_index),
+        weights=_frozen_array(weights),
+        has_weights=_frozen_array(has_weights, dtype=bool),
+        tempo=_frozen_array(tempo),
+        has_tempo=_frozen_array(has_tempo, dtype=bool),
+        decade_index=MappingProxyType(decade_index),
+        decades=_frozen_array(decades),
+        version=hashlib.sha256(version_source.encode("utf-8")).hexdigest(),
+        source_mtime=source_mtime,
+    )
+
+def load_scoring_model(path=GENRE_SEEDS_PATH):
+    """genre_seeds.json을 한 번만 읽고 파싱해 점수 모델을 생성 (실패하면 예외 발생)"""
+    source_mtime = os.stat(path).st_mtime
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    genre_weights, tempo_expectations = parse_genre_seeds(data)
+    if not genre_weights:
+        raise ValueError("장르 시드가 비어 있습니다.")
+    return build_scoring_model(genre_weights, tempo_expectations, DECADE_GROUP_WEIGHTS, source_mtime)
+
+try:
+    _scoring_model = load_scoring_model()
+except Exception as e:
+    app.logger.exception("장르 시드 로드 실패")
+    _scoring_model = build_scoring_model(FALLBACK_GENRE_GROUP_WEIGHTS, {}, DECADE_GROUP_WEIGHTS)
+_scoring_model_checked_at = time.monotonic()
+# 마지막으로 읽기를 시도한 파일 수정 시각 (읽기에 실패한 파일을 반복해서 다시 읽지 않기 위함)
+_scoring_model_seen_mtime = _scoring_model.source_mtime
+_scoring_model_lock = threading.Lock()
+mark_startup_phase("scoring_model")
+
+def get_scoring_model():
+    """
+    현재 점수 모델을 반환합니다.
+    genre_seeds.json의 수정 시각이 바뀌었으면 워커 재시작 없이 새 모델로 교체하며,
+    새 파일을 읽지 못하면 기존 모델을 계속 사용합니다.
+    """
+    global _scoring_model, _scoring_model_checked_at, _scoring_model_seen_mtime
+    now = time.monotonic()
+    if now - _scoring_model_checked_at < SCORING_MODEL_RELOAD_INTERVAL:
+        return _scoring_model
+    with _scoring_model_lock:
+        if now - _scoring_model_checked_at < SCORING_MODEL_RELOAD_INTERVAL:
+            return _scoring_model
+        _scoring_model_checked_at = now
+        try:
+            mtime = os.stat(GENRE_SEEDS_PATH).st_mtime
+            if mtime != _scoring_model_seen_mtime:
+                _scoring_model_seen_mtime = mtime
+                _scoring_model = load_scoring_model()
+                app.logger.info("장르 시드 변경 감지, 점수 모델 갱신: %s", _scoring_model.version[:12])
+        except Exception as e:
+            app.logger.exception("장르 시드 다시 불러오기 실패, 기존 점수 모델 유지")
+    return _scoring_model
+
+#############################################
+# [수정] 기존 함수들: compute_tempo_score, get_lyrics_sentiment, compute_genre_group_scores
+#############################################
+
+def compute_tempo_score(genres, model=None):
+    """각 장르의 예상 BPM 값을 점수 모델에서 참조하여 평균 BPM을 계산한 후, 0~1 범위로 정규화하여 반환"""
+    _, tempo_scores = (model or get_scoring_model()).score_genres([genres])
+    return float(tempo_scores[0])
+
+def lyrics_cache_key(track_title, artist_name):
+    """대소문자와 공백 차이를 없앤 (곡 제목, 아티스트) 캐시 키"""
+    title = " ".join(str(track_title or "").casefold().split())
+    artist = " ".join(str(artist_name or "").casefold().split())
+    return f"{title}\x1f{artist}"
+
+def fetch_lyrics_sentiment(track_title, artist_name):
+    """Genius에서 가사를 검색해 VADER compound 점수를 계산 (가사를 찾지 못하면 None)"""
+    song = genius_breaker.call(genius.search_song, track_title, artist_name)
+    if song and song.lyrics:
+        store_song_lyrics(track_title, artist_name, song)
+        with metrics.time("sentiment_scoring_duration_seconds"):
+            return get_sentiment_engine().compound(song.lyrics)
+    return None
+
+def lookup_lyrics_sentiment(track_title, artist_name):
+    """
+    캐시에 없는 곡의 가사 감성 점수를 Genius에서 조회해 캐시에 저장한 뒤 (점수, 대체 여부)로 반환합니다.
+    가사가 없는 곡도 캐시해 두어 반복 검색을 피합니다. 오류가 나거나 Genius 회로 차단기가 열려 있으면
+    중립값 0을 대체값으로 반환하며(대체 여부 True), 이 점수는 어디에도 캐시하지 않아야 합니다.
+    """
+    key = lyrics_cache_key(track_title, artist_name)
+    try:
+        score = fetch_lyrics_sentiment(track_title, artist_name)
+    except CircuitOpenError:
+        # Genius 장애 중에는 호출 없이 중립값으로 처리 (캐시하지 않음)
+        return 0, True
+    except Exception as e:
+        app.logger.exception(f"가사 감성 분석 중 오류: {track_title} - {artist_name}")
+        return 0, True
+    if score is None:
+        lyrics_sentiment_cache.set_many({key: None}, ttl=LYRICS_NEGATIVE_CACHE_TTL)
+        return 0, False
+    lyrics_sentiment_cache.set_many({key: score})
+    return score, False
+
+def get_lyrics_sentiment(track_title, artist_name):
+    """곡의 가사 감성 점수를 반환 (공유 캐시에 있으면 Genius를 호출하지 않음)"""
+    key = lyrics_cache_key(track_title, artist_name)
+    cached = lyrics_sentiment_cache.get_many([key])
+    if key in cached:
+        score = cached[key]
+        return score if score is not None else 0
+    return lookup_lyrics_sentiment(track_title, artist_name)[0]
+
+def get_lyrics_sentiments_bulk(songs, deadline, on_score=None, cancel=None):
+    """
+    (곡 제목, 아티스트) 목록의 감성 점수를 입력 순서대로 반환합니다.
+    캐시에 없는 곡은 프로세스 공용 스레드 풀에서 동시에 조회하며, deadline(time.monotonic 기준)까지
+    끝나지 않은 곡은 중립값 0으로 채우고 해당 인덱스를 함께 반환합니다.
+    늦게 끝난 조회도 백그라운드에서 계속 진행되어 결과가 캐시에 저장됩니다.
+    반환: (점수 리스트, 마감 시간 초과 인덱스, Genius 오류/차단으로 중립값을 대신 쓴 인덱스)
+    on_score(인덱스, 점수)는 각 곡의 점수가 확정되는 즉시 호출되며,
+    cancel(threading.Event)이 설정되면 아직 시작하지 않은 조회를 취소하고 곧바로 반환합니다.
+    """
+    keys = [lyrics_cache_key(title, artist) for title, artist in songs]
+    cached = lyrics_sentiment_cache.get_many(keys)
+    scores = {}
+    fallback_keys = set()
+    indexes_by_key = {}
+    for index, key in enumerate(keys):
+        indexes_by_key.setdefault(key, []).append(index)
+
+    def resolve(key, score):
+        scores[key] = score
+        if on_score:
+            for index in indexes_by_key[key]:
+                on_score(index, score)
+
+    futures = {}
+    for (title, artist), key in zip(songs, keys):
+        if key in cached:
+            if key not in scores:
+                resolve(key, cached[key] if cached[key] is not None else 0)
+        elif key not in futures:
+            # 다른 요청이 같은 곡을 조회 중이면 그 작업의 결과를 함께 사용
+            futures[key] = lyrics_flight.submit(key, lyrics_executor, lookup_lyrics_sentiment, title, artist)
+    
+    pending = {future: key for key, future in futures.items()}
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (cancel is not None and cancel.is_set()):
+            break
+        # 취소 여부를 주기적으로 확인할 수 있도록 대기 시간을 잘게 나눔
+        timeout = min(remaining, 0.5) if cancel is not None else remaining
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending.pop(future)
+            score, fell_back = future.result()
+            if fell_back:
+                fallback_keys.add(key)
+            resolve(key, score)
+    for future, key in pending.items():
+        lyrics_flight.abandon(key, future)
+    
+    timed_out = [index for index, key in enumerate(keys) if key not in scores]
+    fallbacks = [index for index, key in enumerate(keys) if key in fallback_keys]
+    return [scores.get(key, 0) for key in keys], timed_out, fallbacks
+
+def compute_genre_group_scores(genres, model=None):
+    """
+    입력된 장르 리스트에 해당하는 가중치 배열의 행들을 평균하여,
+    각 그룹별 평균 가중치를 딕셔너리로 반환합니다.
+    """
+    group_scores, _ = (model or get_scoring_model()).score_genres([genres])
+    return dict(zip(GROUP_NAMES, group_scores[0].tolist()))
+
+#############################################
+# 가사 조회용 스레드 풀
+#############################################
+
+# Genius 동시 호출 수 상한 (워커 프로세스 내 모든 요청이 같은 풀을 공유하므로 프로세스 단위 상한이 됨)
+LYRICS_MAX_WORKERS = int(os.getenv("LYRICS_MAX_WORKERS", "4"))
+# /mbti 요청 하나가 가사 감성 분석을 기다리는 최대 시간(초), 요청 시작 시점부터 계산
+LYRICS_DEADLINE_SECONDS = float(os.getenv("LYRICS_DEADLINE_SECONDS", "8"))
+
+lyrics_executor = ThreadPoolExecutor(max_workers=LYRICS_MAX_WORKERS, thread_name_prefix="lyrics")
+
+#############################################
+# 프로세스 메모리 LRU 캐시
+#############################################
+
+class LRUCache:
+    """
+    프로세스 메모리에 보관하는 스레드 안전 LRU 캐시.
+    maxsize를 넘으면 가장 오래 사용하지 않은 항목부터 제거하며, ttl(초)을 주면 만료된 항목은 조회되지 않습니다.
+    """
+
+    def __init__(self, maxsize, ttl=None, name="lru"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, record=True, include_stale=False):
+        """
+        유효한 항목이면 값을 반환하고 최근 사용으로 표시, 없거나 만료되었으면 default 반환
+        record=False이면 히트/미스 통계에 반영하지 않음 (보조 조회용)
+        include_stale=True이면 만료되었지만 아직 밀려나지 않은 항목도 반환 (장애 시 대체값 조회용)
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            expired = entry is not None and entry[1] is not None and entry[1] <= time.monotonic()
+            if entry is None or (expired and not include_stale):
+                if record:
+                    self.misses += 1
+                    metrics.inc("cache_requests_total", cache=self.name, result="miss")
+                return default
+            self._data.move_to_end(key)
+            if record:
+                self.hits += 1
+                metrics.inc("cache_requests_total", cache=self.name, result="hit")
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """이 프로세스의 히트/미스 통계를 반환"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._data),
+            }
+
+#############################################
+# 동일 외부 조회 합치기 (single-flight)
+#############################################
+
+class SingleFlight:
+    """
+    같은 키에 대한 동시 외부 호출을 하나로 합칩니다.
+    먼저 도착한 호출이 실제 조회를 수행하고, 그동안 도착한 같은 키의 호출은 그 결과(또는 예외)를 함께 기다립니다.
+    조회가 끝나면 키를 지우므로 결과를 보관하지는 않습니다 (보관은 캐시의 역할).
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._inflight = {}
+        self._refs = {}
+        # abandon()이 잠금을 쥔 채 Future를 취소하면 완료 콜백(_release)이 같은 스레드에서 잠금을 다시 잡으므로 RLock
+        self._lock = threading.RLock()
+
+    def do(self, key, fn):
+        """key로 진행 중인 호출이 있으면 그 결과를 기다리고, 없으면 fn()을 직접 실행"""
+        return self.do_many([key], lambda keys: {key: fn()})[key]
+
+    def do_many(self, keys, fetch_many):
+        """
+        여러 키를 한 번에 조회합니다. 다른 호출이 이미 조회 중인 키는 그 결과를 기다리고,
+        나머지 키만 fetch_many(키 리스트) → {키: 값}으로 직접 조회합니다. 결과에 없는 키의 값은 None입니다.
+        직접 조회를 모두 끝낸 뒤에만 다른 호출을 기다리므로 호출끼리 서로를 기다리며 멈추지 않습니다.
+        """
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                future = self._inflight.get(key)
+                if future is None:
+                    owned[key] = self._inflight[key] = Future()
+                else:
+                    waiting[key] = future
+            self.leaders += len(owned)
+            self.shared += len(waiting)
+        
+        results = {}
+        if owned:
+            try:
+                fetched = fetch_many(list(owned))
+            except BaseException as e:
+                for future in owned.values():
+                    future.set_exception(e)
+                raise
+            else:
+                for key, future in owned.items():
+                    results[key] = fetched.get(key)
+                    future.set_result(results[key])
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+        for key, future in waiting.items():
+            results[key] = future.result()
+        return results
+
+    def submit(self, key, executor, fn, *args):
+        """
+        key로 진행 중인 작업이 있으면 그 Future를, 없으면 executor에 fn(*args)를 제출한 Future를 반환합니다.
+        결과가 더 이상 필요 없으면 Future.cancel() 대신 abandon()을 호출해야 다른 호출자의 작업이 취소되지 않습니다.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                self._refs[key] += 1
+                return future
+            future = self._inflight[key] = executor.submit(fn, *args)
+            self._refs[key] = 1
+            self.leaders += 1
+        future.add_done_callback(lambda done: self._release(key, done))
+        return future
+
+    def abandon(self, key, future):
+        """
+        submit()으로 받은 Future를 기다리던 호출자가 모두 포기하면 아직 시작하지 않은 작업을 취소합니다.
+        취소는 잠금 안에서 하므로 그 사이에 같은 키로 submit()한 호출이 취소된 Future를 받는 일이 없고,
+        이미 실행 중이라 취소되지 않은 작업은 그대로 두어 이후 호출이 합류할 수 있습니다.
+        """
+        with self._lock:
+            if self._inflight.get(key) is not future:
+                return
+            self._refs[key] -= 1
+            if self._refs[key] == 0:
+                future.cancel()
+
+    def _release(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                del self._refs[key]
+
+    def stats(self):
+        """실제 외부 호출 수(leaders)와 진행 중인 호출에 합류한 수(shared)"""
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._inflight)}
+
+# Spotify 조회 키: ("track", 트랙 ID), ("artist", 아티스트 ID), ("top_tracks", 아티스트 ID)
+spotify_flight = SingleFlight()
+# 가사 조회 키: lyrics_cache_key(곡 제목, 아티스트)
+lyrics_flight = SingleFlight()
+
+#############################################
+# 외부 API 회로 차단기
+#############################################
+
+# 연속 실패(또는 느린 응답) 몇 번에 차단할지, 차단 후 몇 초 뒤에 시험 호출을 허용할지
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+# 이 시간(초)보다 오래 걸린 호출은 성공했더라도 실패로 셈 (search_song은 요청 여러 번으로 이루어짐)
+GENIUS_SLOW_CALL_SECONDS = float(os.getenv("GENIUS_SLOW_CALL_SECONDS", "6"))
+SPOTIFY_SLOW_CALL_SECONDS = float(os.getenv("SPOTIFY_SLOW_CALL_SECONDS", "3"))
+
+class CircuitOpenError(Exception):
+    """회로 차단기가 열려 있어 외부 호출을 건너뛴 경우"""
+
+def error_status(e):
+    """예외의 HTTP 응답 코드 (SpotifyException.http_status 또는 requests HTTPError의 응답 코드, 없으면 None)"""
+    status = getattr(e, "http_status", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+# 요청 내용(잘못된 ID, 없는 항목) 탓으로 실패한 응답 코드
+# 401/403은 인증·권한·할당량 문제로 모든 호출이 함께 실패하므로 장애로 취급해 회로 차단기에 반영
+CLIENT_ERROR_STATUSES = frozenset({400, 404})
+
+def is_client_error(e):
+    """요청 자체가 잘못되어 실패한 경우(400, 404)인지 확인"""
+    return error_status(e) in CLIENT_ERROR_STATUSES
+
+class CircuitBreaker:
+    """
+    외부 API 하나에 대한 회로 차단기.
+    연속 실패(예외 또는 slow_call_seconds보다 느린 응답)가 failure_threshold번 쌓이면 열림(open) 상태가 되어
+    호출을 즉시 CircuitOpenError로 거절하고, reset_seconds가 지나면 시험 호출 하나만 허용(half_open)해
+    성공하면 닫힘(closed)으로, 실패하면 다시 열림으로 전환합니다.
+    잘못된 ID 같은 클라이언트 오류(400, 404)는 외부 장애로 보지 않고 그대로 전달하며,
+    느린 응답 판정에는 rate_limiter(TokenBucket)에서 기다린 시간을 빼고 실제 호출 시간만 사용합니다.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold, reset_seconds, slow_call_seconds, rate_limiter=None):
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        # 호출자가 잠금을 잡은 상태에서 호출
+        if state == self.state:
+            return
+        app.logger.warning(f"회로 차단기 상태 변경: {self.name} {self.state} → {state}")
+        self.state = state
+        if state == self.OPEN:
+            self.opened += 1
+            self._opened_at = time.monotonic()
+
+    def _allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._trial_in_flight):
+                trial = self.state == self.HALF_OPEN
+                self._trial_in_flight = trial
+                self.calls += 1
+                return True, trial
+            self.rejected += 1
+            return False, False
+
+    def _record(self, failed, slow=False, trial=False, neutral=False):
+        """
+        호출 결과 반영. 상태 전환은 닫힘 상태의 호출과 반열림 상태의 시험 호출 결과로만 일어나며,
+        열리기 전에 시작해 늦게 끝난 호출은 통계에만 반영됩니다. neutral이면 상태와 실패 횟수를 바꾸지 않음
+        """
+        with self._lock:
+            if trial:
+                self._trial_in_flight = False
+            if neutral:
+                return
+            if slow:
+                self.slow_calls += 1
+            failed = failed or slow
+            if failed:
+                self.failures += 1
+            if trial and self.state == self.HALF_OPEN:
+                self.consecutive_failures = 1 if failed else 0
+                self._transition(self.OPEN if failed else self.CLOSED)
+            elif self.state == self.CLOSED:
+                self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+                if self.consecutive_failures >= self.failure_threshold:
+                    self._transition(self.OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        """차단기를 거쳐 fn을 호출 (열려 있으면 CircuitOpenError)"""
+        operation = getattr(fn, "__name__", "call")
+        allowed, trial = self._allow()
+        if not allowed:
+            metrics.inc("upstream_rejections_total", service=self.name, operation=operation)
+            raise CircuitOpenError(f"{self.name} 회로 차단기 열림")
+
+        def elapsed():
+            # 속도 제한기에서 기다린 시간은 외부 API의 응답 시간이 아니므로 제외
+            waited = self.rate_limiter.thread_wait_seconds() - waited_before if self.rate_limiter else 0.0
+            return time.monotonic() - started - waited
+
+        waited_before = self.rate_limiter.thread_wait_seconds() if self.rate_limiter else 0.0
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            if is_client_error(e):
+                self._record(failed=False, trial=trial, neutral=True)
+                metrics.inc("upstream_client_errors_total", service=self.name, operation=operation)
+            else:
+                self._record(failed=True, trial=trial)
+                metrics.inc("upstream_errors_total", service=self.name, operation=operation)
+            raise
+        finally:
+            metrics.observe("upstream_request_duration_seconds", elapsed(), service=self.name, operation=operation)
+        self._record(failed=False, slow=elapsed() > self.slow_call_seconds, trial=trial)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "calls": self.calls,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "opened": self.opened,
+            }
+
+genius_breaker = CircuitBreaker(
+    "genius", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, GENIUS_SLOW_CALL_SECONDS, rate_limiter=genius_rate_limiter
+)
+spotify_breaker = CircuitBreaker("spotify", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, SPOTIFY_SLOW_CALL_SECONDS)
+
+#############################################
+# 요청/워커 간에 공유되는 영속 캐시 (SQLite)
+#############################################
+
+# 모든 gunicorn 워커가 같은 파일을 열어 캐시를 공유함
+CACHE_DB_PATH = os.getenv("APP_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.sqlite3"))
+# 아티스트 → 장르 캐시 유효 기간(초)과 최대 보관 개수
+ARTIST_GENRE_CACHE_TTL = int(os.getenv("ARTIST_GENRE_CACHE_TTL", str(7 * 24 * 3600)))
+ARTIST_GENRE_CACHE_MAX_ENTRIES = int(os.getenv("ARTIST_GENRE_CACHE_MAX_ENTRIES", "50000"))
+# (곡 제목, 아티스트) → 가사 감성 점수 캐시 유효 기간(초)과 최대 보관 개수
+# 가사를 찾지 못한 곡은 별도의(더 짧은) TTL로 "없음"을 저장해 Genius 재검색을 막음
+LYRICS_CACHE_TTL = int(os.getenv("LYRICS_CACHE_TTL", str(30 * 24 * 3600)))
+LYRICS_NEGATIVE_CACHE_TTL = int(os.getenv("LYRICS_NEGATIVE_CACHE_TTL", str(24 * 3600)))
+LYRICS_CACHE_MAX_ENTRIES = int(os.getenv("LYRICS_CACHE_MAX_ENTRIES", "200000"))
+# Spotify 장애 시 만료된 캐시 항목(아티스트 장르, 인기곡, 트랙 메타데이터)을 대체값으로 쓸 수 있는 기간(초)
+SPOTIFY_STALE_TTL = int(os.getenv("SPOTIFY_STALE_TTL", str(7 * 24 * 3600)))
+# 장애 대비용 트랙 메타데이터 보관 개수
+TRACK_METADATA_CACHE_MAX_ENTRIES = int(os.getenv("TRACK_METADATA_CACHE_MAX_ENTRIES", "100000"))
+# 아티스트 인기곡(/artist_tracks 응답) 캐시 유효 기간(초)과 최대 보관 개수
+ARTIST_TOP_TRACKS_CACHE_TTL = int(os.getenv("ARTIST_TOP_TRACKS_CACHE_TTL", str(6 * 3600)))
+ARTIST_TOP_TRACKS_CACHE_MAX_ENTRIES = int(os.getenv("ARTIST_TOP_TRACKS_CACHE_MAX_ENTRIES", "20000"))
+# 조회된 항목의 최근 사용 시각(LRU 기준)을 갱신하는 최소 간격(초). 이보다 최근에 갱신된 항목은 조회해도 쓰지 않음
+CACHE_TOUCH_INTERVAL = int(os.getenv("CACHE_TOUCH_INTERVAL", "300"))
+
+def connect_shared_db(local, db_path, create_tables):
+    """
+    threading.local 객체에 스레드(및 프로세스)별 SQLite 커넥션을 보관해 재사용합니다.
+    처음 연결할 때 WAL 모드를 켜고 create_tables(conn)으로 필요한 테이블을 만듭니다.
+    """
+    conn = getattr(local, "conn", None)
+    if conn is not None and local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    create_tables(conn)
+    local.conn = conn
+    local.pid = os.getpid()
+    return conn
+
+class SQLiteTTLCache:
+    """
+    SQLite 테이블 하나를 키-값 캐시로 사용하는 클래스.
+    값은 JSON으로 저장되며, TTL이 지난 항목은 조회되지 않고 최대 개수를 넘으면
+    가장 오래 조회되지 않은 항목부터 제거(LRU)합니다.
+    조회는 대부분 읽기만 하도록, 최근 사용 시각은 CACHE_TOUCH_INTERVAL보다 오래된 항목만 갱신하고
+    히트/미스 횟수는 프로세스 메모리에만 셉니다 (워커 합계는 /metrics의 cache_requests_total).
+    """
+
+    # 한 번의 IN (...) 질의에 넣을 최대 키 개수 (SQLite 변수 개수 제한 대비)
+    _QUERY_CHUNK = 500
+    # 몇 번의 쓰기마다 만료/초과 항목을 정리할지
+    _EVICT_EVERY = 100
+
+    def __init__(self, db_path, table, ttl, max_entries, stale_ttl=0):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 만료 후에도 이 시간(초) 동안은 지우지 않고 외부 API 장애 시 대체값(stale)으로 사용
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        return connect_shared_db(self._local, self.db_path, self._create_tables)
+
+    def _create_tables(self, conn):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_access ON {self.table} (last_access)")
+
+    def get_many(self, keys, record=True, include_stale=False):
+        """
+        유효한(만료되지 않은) 항목만 {키: 값} 딕셔너리로 반환하고 히트/미스를 기록
+        최근 사용 시각이 CACHE_TOUCH_INTERVAL보다 오래된 항목이 있을 때만 쓰기 트랜잭션으로 갱신
+        record=False이면 최근 사용 시각과 히트/미스 통계를 갱신하지 않음 (미리 채우기 등 보조 조회용)
+        include_stale=True이면 만료 후 stale_ttl 이내의 항목도 반환 (장애 시 대체값 조회용)
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        cutoff = now - self.stale_ttl if include_stale else now
+        found = {}
+        stale_access = []
+        try:
+            conn = self._connect()
+            for chunk in chunked(keys, self._QUERY_CHUNK):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, last_access FROM {self.table} WHERE key IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, cutoff),
+                ).fetchall()
+                for key, value, last_access in rows:
+                    found[key] = json.loads(value)
+                    if last_access < now - CACHE_TOUCH_INTERVAL:
+                        stale_access.append(key)
+            if record and stale_access:
+                with conn:
+                    conn.execute("BEGIN")
+                    for chunk in chunked(stale_access, self._QUERY_CHUNK):
+                        placeholders = ",".join("?" * len(chunk))
+                        conn.execute(
+                            f"UPDATE {self.table} SET last_access = ? WHERE key IN ({placeholders})",
+                            (now, *chunk),
+                        )
+        except Exception as e:
+            app.logger.exception(f"캐시 조회 실패: {self.table}")
+        if not record:
+            return found
+        hit_count, miss_count = len(found), len(keys) - len(found)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += miss_count
+        metrics.inc("cache_requests_total", hit_count, cache=self.table, result="hit")
+        metrics.inc("cache_requests_total", miss_count, cache=self.table, result="miss")
+        return found
+
+    def set_many(self, items, ttl=None):
+        """{키: 값} 항목들을 저장 (ttl을 지정하지 않으면 기본 TTL 사용)"""
+        if not items:
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    [(key, json.dumps(value, ensure_ascii=False), expires_at, now) for key, value in items.items()],
+                )
+            with self._lock:
+                self._writes += len(items)
+                need_evict = self._writes >= self._EVICT_EVERY
+                if need_evict:
+                    self._writes = 0
+            if need_evict:
+                self.evict()
+        except Exception as e:
+            app.logger.exception(f"캐시 저장 실패: {self.table}")
+
+    def evict(self):
+        """만료 후 stale_ttl이 지난 항목을 지우고, 최대 개수를 넘는 항목은 오래 조회되지 않은 순서로 제거"""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time() - self.stale_ttl,))
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        """이 프로세스의 히트/미스 통계와 저장된 항목 수를 반환 (워커 합계는 /metrics에서 확인)"""
+        with self._lock:
+            total = self.hits + self.misses
+            result = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+        try:
+            result["entries"] = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except Exception as e:
+            app.logger.exception(f"캐시 통계 조회 실패: {self.table}")
+        return result
+
+# 아티스트 ID → 정규화된 장르 리스트 캐시
+artist_genre_cache = SQLiteTTLCache(
+    CACHE_DB_PATH, "artist_genres", ARTIST_GENRE_CACHE_TTL, ARTIST_GENRE_CACHE_MAX_ENTRIES, stale_ttl=SPOTIFY_STALE_TTL
+)
+# 정규화된 (곡 제목, 아티스트) → VADER compound 점수 캐시 (가사 없음은 None으로 저장)
+lyrics_sentiment_cache = SQLiteTTLCache(CACHE_DB_PATH, "lyrics_sentiment", LYRICS_CACHE_TTL, LYRICS_CACHE_MAX_ENTRIES)
+# 아티스트 ID → /artist_tracks 응답 형식의 인기곡 리스트 캐시 (검색 직후 백그라운드에서 미리 채워짐)
+artist_top_tracks_cache = SQLiteTTLCache(
+    CACHE_DB_PATH, "artist_top_tracks", ARTIST_TOP_TRACKS_CACHE_TTL, ARTIST_TOP_TRACKS_CACHE_MAX_ENTRIES,
+    stale_ttl=SPOTIFY_STALE_TTL
+)
+# 트랙 ID → 분류에 필요한 필드만 남긴 트랙 메타데이터 (Spotify 장애 시에만 읽는 대체값 저장소)
+track_metadata_cache = SQLiteTTLCache(
+    CACHE_DB_PATH, "track_metadata", SPOTIFY_STALE_TTL, TRACK_METADATA_CACHE_MAX_ENTRIES
+)
+
+#############################################
+# 가사 원문 보관소 (Genius 곡 ID 기준)
+#############################################
+
+# 가져온 가사 원문을 압축해 보관할 SQLite 파일 (캐시와 달리 만료되지 않음, 빈 값이면 보관하지 않음)
+LYRICS_CORPUS_DB_PATH = os.getenv(
+    "LYRICS_CORPUS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lyrics_corpus.sqlite3")
+)
+LYRICS_CORPUS_COMPRESSION_LEVEL = int(os.getenv("LYRICS_CORPUS_COMPRESSION_LEVEL", "6"))
+
+class LyricsCorpusStore:
+    """
+    Genius에서 가져온 가사 원문을 곡 ID별로 zlib 압축해 보관하는 저장소.
+    감성 점수 계산 방식이 바뀌어도 Genius를 다시 스크래핑하지 않고 보관된 가사로 재채점할 수 있습니다.
+    여러 (곡 제목, 아티스트) 캐시 키가 같은 Genius 곡을 가리킬 수 있으므로 키 → 곡 ID 대응을 따로 저장합니다.
+    """
+
+    def __init__(self, db_path, compression_level=6):
+        self.db_path = db_path
+        self.compression_level = compression_level
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        return connect_shared_db(self._local, self.db_path, self._create_tables)
+
+    def _create_tables(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lyrics ("
+            "song_id INTEGER PRIMARY KEY, digest TEXT NOT NULL, lyrics BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lyrics_keys ("
+            "key TEXT PRIMARY KEY, song_id INTEGER NOT NULL, title TEXT NOT NULL, artist TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS lyrics_keys_song_id ON lyrics_keys (song_id)")
+
+    def put(self, key, title, artist, song_id, lyrics):
+        """가사 원문을 저장 (같은 곡 ID에 같은 내용이 이미 있으면 압축/쓰기를 생략하고 키 대응만 갱신)"""
+        digest = hashlib.sha256(lyrics.encode("utf-8")).hexdigest()
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT digest FROM lyrics WHERE song_id = ?", (song_id,)).fetchone()
+            with conn:
+                conn.execute("BEGIN")
+                if row is None or row[0] != digest:
+                    blob = zlib.compress(lyrics.encode("utf-8"), self.compression_level)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO lyrics (song_id, digest, lyrics, stored_at) VALUES (?, ?, ?, ?)",
+                        (song_id, digest, blob, time.time()),
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO lyrics_keys (key, song_id, title, artist) VALUES (?, ?, ?, ?)",
+                    (key, song_id, title, artist),
+                )
+            with self._lock:
+                self.writes += 1
+        except Exception as e:
+            app.logger.exception(f"가사 원문 저장 실패: {title} - {artist}")
+
+    def get(self, song_id):
+        """곡 ID의 가사 원문 (없으면 None)"""
+        row = self._connect().execute("SELECT lyrics FROM lyrics WHERE song_id = ?", (song_id,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def iter_compressed(self, batch_size=500):
+        """(곡 ID, 압축된 가사) 묶음을 곡 ID 순서로 반환 (재채점 작업에 압축된 채로 넘기기 위함)"""
+        conn = self._connect()
+        last_id = -1
+        while True:
+            rows = conn.execute(
+                "SELECT song_id, lyrics FROM lyrics WHERE song_id > ? ORDER BY song_id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def keys_for(self, song_ids):
+        """곡 ID → 해당 곡을 가리키는 (곡 제목, 아티스트) 캐시 키 리스트"""
+        keys = {}
+        conn = self._connect()
+        for chunk in chunked(list(song_ids), SQLiteTTLCache._QUERY_CHUNK):
+            placeholders = ",".join("?" * len(chunk))
+            for key, song_id in conn.execute(
+                f"SELECT key, song_id FROM lyrics_keys WHERE song_id IN ({placeholders})", chunk
+            ):
+                keys.setdefault(song_id, []).append(key)
+        return keys
+
+    def stats(self):
+        """저장된 곡 수, 키 수, 압축된 가사 크기와 이 프로세스의 저장 횟수"""
+        result = {"process_writes": self.writes}
+        try:
+            conn = self._connect()
+            songs, compressed_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(lyrics)), 0) FROM lyrics").fetchone()
+            keys = conn.execute("SELECT COUNT(*) FROM lyrics_keys").fetchone()[0]
+            result.update({"songs": songs, "keys": keys, "compressed_bytes": compressed_bytes})
+        except Exception as e:
+            app.logger.exception("가사 원문 보관소 통계 조회 실패")
+        return result
+
+lyrics_corpus = LyricsCorpusStore(LYRICS_CORPUS_DB_PATH, LYRICS_CORPUS_COMPRESSION_LEVEL) if LYRICS_CORPUS_DB_PATH else None
+
+def store_song_lyrics(track_title, artist_name, song):
+    """가져온 Genius 곡의 가사 원문을 보관소에 저장 (보관소가 꺼져 있거나 곡 ID가 없으면 무시)"""
+    song_id = getattr(song, "_id", None)
+    if lyrics_corpus is None or song_id is None:
+        return
+    lyrics_corpus.put(lyrics_cache_key(track_title, artist_name), track_title, artist_name, song_id, song.lyrics)
+
+#############################################
+# 분류 결과 캐시
+#############################################
+
+# 같은 곡 조합의 분류 결과를 보관할 최대 개수
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+classification_cache = LRUCache(RESULT_CACHE_SIZE, name="classification")
+_classification_cache_fingerprint = None
+
+def classification_cache_key(track_ids, model):
+    """
+    정렬·중복 제거한 트랙 ID 집합의 해시를 캐시 키로 사용합니다.
+    점수 모델(장르 시드, 데케이드 가중치)이 바뀌면 기존 결과를 모두 버려 바뀐 기준으로 다시 계산되도록 합니다.
+    """
+    global _classification_cache_fingerprint
+    fingerprint = model.version
+    if fingerprint != _classification_cache_fingerprint:
+        classification_cache.clear()
+        _classification_cache_fingerprint = fingerprint
+    canonical = "\n".join(sorted(set(track_ids)))
+    return hashlib.sha256(f"{fingerprint}\n{canonical}".encode("utf-8")).hexdigest()
+
+#############################################
+# /search 자동완성 결과 캐시
+#############################################
+
+# 검색어별 결과 캐시 유효 기간(초)과 최대 보관 개수
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+# /search가 돌려주는 트랙, 아티스트 개수
+SEARCH_LIMIT = 5
+
+# 정규화된 검색어 → {"tracks", "artists", "track_texts", "artist_texts", "complete"}
+search_cache = LRUCache(SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL, name="search")
+# 접두어 캐시를 좁혀서 응답한 횟수
+search_prefix_hits = 0
+_search_stats_lock = threading.Lock()
+
+def normalize_search_query(query):
+    """대소문자와 공백 차이를 무시하도록 검색어를 정규화"""
+    return " ".join(query.casefold().split())
+
+# 검색 결과 좁히기에서 무시할 문자 (AC/DC, Guns N' Roses 등의 구두점)
+SEARCH_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+
+def fold_search_text(text):
+    """
+    접두어 결과를 좁힐 때 쓰는 비교용 문자열. Spotify 검색처럼 대소문자, 악센트(Beyoncé → beyonce),
+    구두점(AC/DC → acdc) 차이를 무시하도록 검색어와 결과 텍스트에 똑같이 적용합니다.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = unicodedata.normalize("NFC", "".join(ch for ch in decomposed if not unicodedata.combining(ch)))
+    return " ".join(SEARCH_PUNCTUATION_PATTERN.sub("", stripped).split())
+
+def narrow_search_entry(entry, normalized):
+    """
+    전체 결과가 담긴 접두어 캐시 항목에서 더 긴 검색어의 모든 단어를 포함하는 결과만 순서대로 남깁니다.
+    (트랙은 곡 제목/아티스트/앨범 이름, 아티스트는 이름 기준, fold_search_text로 접은 문자열끼리 비교)
+    """
+    terms = fold_search_text(normalized).split()
+    track_keep = [i for i, text in enumerate(entry["track_texts"]) if all(term in text for term in terms)]
+    artist_keep = [i for i, text in enumerate(entry["artist_texts"]) if all(term in text for term in terms)]
+    return {
+        "tracks": [entry["tracks"][i] for i in track_keep],
+        "artists": [entry["artists"][i] for i in artist_keep],
+        "track_texts": [entry["track_texts"][i] for i in track_keep],
+        "artist_texts": [entry["artist_texts"][i] for i in artist_keep],
+        "complete": True,
+    }
+
+def lookup_search_cache(normalized):
+    """
+    캐시된 검색 결과를 찾습니다. 같은 검색어가 없으면 더 짧은 접두어 중
+    Spotify가 일치 항목을 모두 돌려준(total이 limit 이하인) 결과를 찾아 로컬에서 좁혀 응답합니다.
+    (자동완성 중 검색어가 길어질수록 일치 항목은 접두어 결과의 부분집합이 되므로 이때만 재사용)
+    좁힌 결과는 Spotify의 검색 규칙과 완전히 같지는 않으므로 더 긴 검색어의 캐시 항목으로 저장하지 않습니다.
+    """
+    global search_prefix_hits
+    entry = search_cache.get(normalized)
+    if entry is not None:
+        return entry
+    for end in range(len(normalized) - 1, 0, -1):
+        prefix_entry = search_cache.get(normalized[:end], record=False)
+        if prefix_entry is None or not prefix_entry["complete"]:
+            continue
+        entry = narrow_search_entry(prefix_entry, normalized)
+        with _search_stats_lock:
+            search_prefix_hits += 1
+        return entry
+    return None
+
+#############################################
+# 비동기 /mbti 작업 저장소
+#############################################
+
+# 백그라운드에서 동시에 실행할 비동기 분류 작업 수, 실행을 기다릴 수 있는 작업 수, 완료된 작업 결과 보관 시간(초)
+MBTI_JOB_WORKERS = int(os.getenv("MBTI_JOB_WORKERS", "4"))
+MBTI_JOB_MAX_QUEUED = int(os.getenv("MBTI_JOB_MAX_QUEUED", "16"))
+MBTI_JOB_TTL = int(os.getenv("MBTI_JOB_TTL", "3600"))
+# /mbti/stream 분류를 동시에 실행할 수와 실행을 기다릴 수 있는 연결 수 (비동기 작업과 스레드를 나눠 쓰지 않음)
+MBTI_STREAM_WORKERS = int(os.getenv("MBTI_STREAM_WORKERS", "4"))
+MBTI_STREAM_MAX_QUEUED = int(os.getenv("MBTI_STREAM_MAX_QUEUED", "8"))
+
+class ExecutorBusyError(Exception):
+    """실행기의 대기열이 가득 차 새 작업을 받을 수 없는 경우"""
+
+class BoundedExecutor:
+    """
+    대기열 길이가 제한된 스레드 풀.
+    실행 중이거나 기다리는 작업이 max_workers + max_queued개에 이르면 새 작업을 쌓지 않고 ExecutorBusyError로 거절하므로,
+    요청이 몰려도 메모리와 대기 시간이 한없이 늘어나지 않고 호출하는 쪽에서 바로 503으로 응답할 수 있습니다.
+    """
+
+    def __init__(self, max_workers, max_queued, thread_name_prefix):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._capacity = max_workers + max_queued
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_use >= self._capacity:
+                self.rejected += 1
+                raise ExecutorBusyError()
+            self._in_use += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_use -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "in_use": self._in_use,
+                "rejected": self.rejected,
+            }
+
+class MBTIJobStore:
+    """
+    비동기 분류 작업의 상태와 결과를 SQLite에 보관하는 클래스.
+    폴링 요청이 작업을 실행한 워커와 다른 gunicorn 워커로 가더라도 결과를 조회할 수 있습니다.
+    """
+
+    def __init__(self, db_path, ttl):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        return connect_shared_db(self._local, self.db_path, self._create_tables)
+
+    def _create_tables(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS mbti_jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, http_status INTEGER, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def create(self):
+        """새 작업을 pending 상태로 등록하고 작업 ID를 반환 (오래된 작업은 이때 정리)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM mbti_jobs WHERE updated_at < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO mbti_jobs (job_id, status, created_at, updated_at) VALUES (?, 'pending', ?, ?)",
+                (job_id, now, now),
+            )
+        return job_id
+
+    def update(self, job_id, status, result=None, http_status=None):
+        """작업 상태(running/done/failed)와 결과를 기록"""
+        conn = self._connect()
+        conn.execute(
+            "UPDATE mbti_jobs SET status = ?, result = ?, http_status = ?, updated_at = ? WHERE job_id = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             http_status, time.time(), job_id),
+        )
+
+    def get(self, job_id):
+        """작업 정보를 딕셔너리로 반환, 없거나 만료되었으면 None"""
+        row = self._connect().execute(
+            "SELECT status, result, http_status FROM mbti_jobs WHERE job_id = ? AND updated_at >= ?",
+            (job_id, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, http_status = row
+        return {"status": status, "result": json.loads(result) if result else {}, "http_status": http_status}
+
+mbti_jobs = MBTIJobStore(CACHE_DB_PATH, MBTI_JOB_TTL)
+mbti_job_executor = BoundedExecutor(MBTI_JOB_WORKERS, MBTI_JOB_MAX_QUEUED, thread_name_prefix="mbti-job")
+mbti_stream_executor = BoundedExecutor(MBTI_STREAM_WORKERS, MBTI_STREAM_MAX_QUEUED, thread_name_prefix="mbti-stream")
+
+#############################################
+# Spotify 메타데이터 일괄 조회 (tracks / artists 벌크 엔드포인트)
+#############################################
+
+# Spotify의 /tracks, /artists 벌크 엔드포인트가 한 번에 허용하는 최대 ID 개수
+SPOTIFY_BATCH_SIZE = 50
+
+def chunked(items, size):
+    """리스트를 size 개씩 잘라 순서대로 반환"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Spotify ID 형식 (base62 22자), 형식이 다른 ID는 묶음 요청 전체를 400으로 실패시키므로 미리 제외
+SPOTIFY_ID_PATTERN = re.compile(r"[0-9A-Za-z]{22}")
+
+def valid_spotify_ids(ids, kind):
+    """중복과 형식이 잘못된 Spotify ID를 제외 (제외한 ID는 경고 로그로 남김)"""
+    unique_ids = list(dict.fromkeys(i for i in ids if i))
+    valid = [i for i in unique_ids if isinstance(i, str) and SPOTIFY_ID_PATTERN.fullmatch(i)]
+    if len(valid) < len(unique_ids):
+        app.logger.warning(f"형식이 잘못된 Spotify {kind} ID 제외: {[i for i in unique_ids if i not in valid]}")
+    return valid
+
+def fetch_spotify_chunks(ids, fetch_chunk, field, label):
+    """
+    ids를 SPOTIFY_BATCH_SIZE개씩 벌크 엔드포인트(sp.tracks, sp.artists)로 조회해
+    ({ID: 항목}, 장애로 조회하지 못한 ID 리스트)를 반환합니다.
+    응답의 field 리스트는 요청 순서를 유지하며, 존재하지 않는 ID의 항목은 None입니다.
+    묶음이 잘못된 요청(400)으로 거절되면 나머지 ID까지 잃지 않도록 ID마다 따로 다시 조회하고,
+    따로 조회해도 400/404로 거절되는 ID는 존재하지 않는 것으로 처리합니다.
+    인증/권한 오류(401, 403) 등 ID와 무관한 실패는 묶음 전체를 장애로 보고 만료된 캐시로 대체하도록 반환합니다.
+    """
+    fetched = {}
+    failed_ids = []
+
+    def fetch_into(chunk):
+        try:
+            items = spotify_breaker.call(fetch_chunk, chunk).get(field, [])
+        except CircuitOpenError:
+            failed_ids.extend(chunk)
+            return
+        except Exception as e:
+            status = error_status(e)
+            if status == 400 and len(chunk) > 1:
+                app.logger.warning(f"{label} 일괄 조회 거절, ID별로 다시 조회: {e}")
+                for single in chunk:
+                    fetch_into([single])
+                return
+            if status in (400, 404) and len(chunk) == 1:
+                app.logger.warning(f"{label} 조회 거절: {chunk[0]} ({e})")
+                return
+            app.logger.exception(f"{label} 일괄 조회 실패: {chunk}")
+            failed_ids.extend(chunk)
+            return
+        for key, item in zip(chunk, items):
+            if item:
+                fetched[key] = item
+
+    for chunk in chunked(ids, SPOTIFY_BATCH_SIZE):
+        fetch_into(chunk)
+    return fetched, failed_ids
 
-# 가사 가져오기 및 감성 분석용 라이브러리 (TextBlob 대신 VADER 사용)
-import nltk
-nltk.download('vader_lexicon')
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import lyricsgenius
+# 장애로 조회하지 못했고 대체값도 없는 항목 (존재하지 않는 항목과 구분하기 위한 표시)
+UPSTREAM_UNAVAILABLE = object()
 
-# .env 파일의 환경 변수 로드
-load_dotenv()
+def fetch_tracks_bulk(track_ids, failed=None):
+    """
+    트랙 ID들을 중복 제거 후 sp.tracks()로 50개씩 조회하여 {트랙 ID: 트랙 정보} 딕셔너리로 반환
+    failed 리스트를 넘기면 Spotify 장애로 조회하지 못한(저장된 메타데이터도 없는) 트랙 ID를 추가합니다.
+    """
+    unique_ids = valid_spotify_ids(track_ids, "트랙")
 
-app = Flask(__name__)
+    def fetch(keys):
+        items, failed_ids = fetch_spotify_chunks([tid for _, tid in keys], sp.tracks, "tracks", "트랙 메타데이터")
+        fetched = {("track", tid): item for tid, item in items.items()}
+        track_metadata_cache.set_many({tid: slim_track(item) for (_, tid), item in fetched.items()})
+        if failed_ids:
+            # Spotify 장애 시 예전에 받아 둔 메타데이터로 대체
+            stale = track_metadata_cache.get_many(failed_ids, record=False)
+            app.logger.warning("Spotify 트랙 조회 실패, 저장된 메타데이터 사용: %d/%d곡", len(stale), len(failed_ids))
+            fetched.update({("track", tid): item for tid, item in stale.items()})
+            fetched.update({("track", tid): UPSTREAM_UNAVAILABLE for tid in failed_ids if tid not in stale})
+        return fetched
 
-# 환경 변수에서 Spotify 클라이언트 ID, Secret, Genius 토큰 가져오기
-client_id = os.getenv("SPOTIPY_CLIENT_ID")
-client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
-genius_token = os.getenv("GENIUS_ACCESS_TOKEN")
+    # 다른 요청이 조회 중인 트랙은 그 결과를 기다리고 나머지만 조회
+    results = spotify_flight.do_many([("track", tid) for tid in unique_ids], fetch)
+    if failed is not None:
+        failed.extend(tid for (_, tid), item in results.items() if item is UPSTREAM_UNAVAILABLE)
+    return {tid: item for (_, tid), item in results.items() if item and item is not UPSTREAM_UNAVAILABLE}
 
-# Spotify Client Credentials Flow 설정
-client_credentials_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+def fetch_artist_genres_bulk(artist_ids, failed=None):
+    """
+    아티스트 ID들의 정규화된 장르 리스트를 {아티스트 ID: 장르 리스트} 딕셔너리로 반환합니다.
+    공유 캐시에 없는 아티스트만 sp.artists()로 50개씩 조회한 뒤 캐시에 저장합니다.
+    failed 리스트를 넘기면 Spotify 장애로 조회하지 못한(만료된 캐시도 없는) 아티스트 ID를 추가합니다.
+    """
+    unique_ids = valid_spotify_ids(artist_ids, "아티스트")
+    genre_map = artist_genre_cache.get_many(unique_ids)
+    missing_ids = [aid for aid in unique_ids if aid not in genre_map]
 
-# Genius 객체 생성 (lyricsgenius 사용)
-genius = lyricsgenius.Genius(genius_token, skip_non_songs=True, excluded_terms=["(Remix)", "(Live)"])
+    def fetch(keys):
+        items, failed_ids = fetch_spotify_chunks([aid for _, aid in keys], sp.artists, "artists", "아티스트 정보")
+        fetched = {aid: [normalize_genre(g) for g in item.get("genres", [])] for aid, item in items.items()}
+        artist_genre_cache.set_many(fetched)
+        if failed_ids:
+            # Spotify 장애 시 만료된 캐시 항목으로 대체
+            stale = artist_genre_cache.get_many(failed_ids, record=False, include_stale=True)
+            app.logger.warning("Spotify 아티스트 조회 실패, 만료된 캐시 사용: %d/%d명", len(stale), len(failed_ids))
+            fetched.update(stale)
+            fetched.update({aid: UPSTREAM_UNAVAILABLE for aid in failed_ids if aid not in stale})
+        return {("artist", aid): genres for aid, genres in fetched.items()}
 
-# 전역 VADER 감성 분석기 생성
-sentiment_analyzer = SentimentIntensityAnalyzer()
+    # 다른 요청이 조회 중인 아티스트는 그 결과를 기다리고 나머지만 조회
+    results = spotify_flight.do_many([("artist", aid) for aid in missing_ids], fetch)
+    if failed is not None:
+        failed.extend(aid for (_, aid), genres in results.items() if genres is UPSTREAM_UNAVAILABLE)
+    genre_map.update({
+        aid: genres for (_, aid), genres in results.items() if genres is not None and genres is not UPSTREAM_UNAVAILABLE
+    })
+    return genre_map
 
-# 디버그용: 액세스 토큰 출력
-try:
-    token_info = client_credentials_manager.get_access_token(as_dict=False)
-    print("Access token:", token_info)
-except Exception as e:
-    print("Access token 발급 실패:", e)
+def get_primary_artist(track_detail):
+    """트랙의 첫 번째(대표) 아티스트 정보를 반환, 없으면 빈 딕셔너리"""
+    artists = track_detail.get("artists", [])
+    return artists[0] if artists else {}
 
-# 로깅 설정
-logging.basicConfig(level=logging.DEBUG)
+# 장애 대비용으로 저장하는 트랙 필드 (분류와 진행 이벤트, 응답 항목에 쓰이는 값)
+SLIM_TRACK_FIELDS = ("id", "name", "popularity", "duration_ms", "explicit", "preview_url")
 
-#############################################
-# DECADE_GROUP_WEIGHTS: 발매 연도(데케이드)별 음악적 트렌드를 반영하는 가중치
-#############################################
-# 개선된 DECADE_GROUP_WEIGHTS 예시
+def slim_track(item):
+    """트랙 객체에서 SLIM_TRACK_FIELDS와 앨범 발매일/이미지, 아티스트 ID/이름만 남김"""
+    slim = {field: item[field] for field in SLIM_TRACK_FIELDS if field in item}
+    if "album" in item:
+        slim["album"] = {field: item["album"][field] for field in ("release_date", "images") if field in item["album"]}
+    if "artists" in item:
+        slim["artists"] = [{"id": artist.get("id"), "name": artist.get("name")} for artist in item["artists"]]
+    return slim
 
-DECADE_GROUP_WEIGHTS = {
-    "1960s": {
-        "칠 가이": 0.25,       # 차분하고 전통적인 느낌
-        "미식가": 0.25,       # 섬세한 음악 감상
-        "BGM 마스터": 0.15,   # 배경 음악으로 적합
-        "클러버": 0.05,       # 클럽 분위기는 거의 없음
-        "사운드 실험가": 0.05, # 실험적 요소는 미미함
-        "클래식 수호자": 0.25  # 클래식과 전통적 가치 강조
-    },
-    "1970s": {
-        "칠 가이": 0.20,
-        "미식가": 0.20,
-        "BGM 마스터": 0.15,
-        "클러버": 0.20,       # 디스코와 펑크의 등장으로 댄스 분위기 상승
-        "사운드 실험가": 0.10,
-        "클래식 수호자": 0.15
-    },
-    "1980s": {
-        "칠 가이": 0.20,
-        "미식가": 0.20,
-        "BGM 마스터": 0.15,
-        "클러버": 0.25,       # 신스팝, 전자음악의 부상 → 댄스/클럽 분위기 강화
-        "사운드 실험가": 0.10,
-        "클래식 수호자": 0.10
-    },
-    "1990s": {
-        "칠 가이": 0.25,
-        "미식가": 0.15,
-        "BGM 마스터": 0.15,
-        "클러버": 0.25,       # 얼터너티브, 힙합 등으로 클럽 분위기와 에너지 상승
-        "사운드 실험가": 0.10,
-        "클래식 수호자": 0.10
-    },
-    "2000s": {
-        "칠 가이": 0.30,
-        "미식가": 0.20,
-        "BGM 마스터": 0.10,
-        "클러버": 0.20,
-        "사운드 실험가": 0.10,
-        "클래식 수호자": 0.10
-    },
-    "2010s": {
-        "칠 가이": 0.25,
-        "미식가": 0.20,
-        "BGM 마스터": 0.10,
-        "클러버": 0.30,       # EDM과 클럽 문화의 영향
-        "사운드 실험가": 0.10,
-        "클래식 수호자": 0.05
-    },
-    "2020s": {
-        "칠 가이": 0.25,
-        "미식가": 0.20,
-        "BGM 마스터": 0.10,
-        "클러버": 0.25,
-        "사운드 실험가": 0.15,  # 다양한 실험적 음악의 부상
-        "클래식 수호자": 0.05
+def format_track_item(item):
+    """Spotify 트랙 객체를 /search, /artist_tracks 응답의 트랙 항목 형식으로 변환"""
+    album_images = item.get("album", {}).get("images", [])
+    album_image = album_images[0]["url"] if album_images else ""
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "artist": ", ".join([artist["name"] for artist in item["artists"]]),
+        "album_image": album_image,
+        "preview_url": item.get("preview_url")
     }
-}
 
+def fetch_artist_top_tracks(artist_id, cached=None):
+    """
+    아티스트 인기곡을 /artist_tracks 응답 형식의 리스트로 반환합니다.
+    공유 캐시에 없을 때만 sp.artist_top_tracks()를 호출하고 결과를 캐시에 저장합니다.
+    cached에 미리 조회한 캐시 결과({아티스트 ID: 인기곡 리스트})를 넘기면 캐시를 다시 읽지 않습니다.
+    """
+    if cached is None:
+        cached = artist_top_tracks_cache.get_many([artist_id])
+    if artist_id in cached:
+        return cached[artist_id]
+
+    def fetch():
+        top_tracks_data = spotify_breaker.call(sp.artist_top_tracks, artist_id, country='US')
+        tracks = [format_track_item(item) for item in top_tracks_data.get('tracks', [])]
+        artist_top_tracks_cache.set_many({artist_id: tracks})
+        return tracks
+
+    try:
+        return spotify_flight.do(("top_tracks", artist_id), fetch)
+    except Exception as e:
+        # Spotify 장애 시 만료된 캐시 항목이 있으면 대체
+        stale = artist_top_tracks_cache.get_many([artist_id], record=False, include_stale=True)
+        if artist_id not in stale:
+            raise
+        app.logger.warning(f"Spotify 인기곡 조회 실패, 만료된 캐시 사용: {artist_id} ({e})")
+        return stale[artist_id]
 
 #############################################
-# [추가] 장르 시드 및 템포 기대치 로드를 위한 함수들
+# 검색 결과 아티스트의 인기곡 미리 채우기
 #############################################
 
-def normalize_genre(genre):
-    """장르 문자열의 앞뒤 공백 제거 및 소문자화"""
-    if not isinstance(genre, str):
-        return ""
-    return genre.strip().lower()
+# 미리 채우기에 사용할 백그라운드 스레드 수와 대기열에 쌓아 둘 최대 아티스트 수
+ARTIST_PREWARM_WORKERS = int(os.getenv("ARTIST_PREWARM_WORKERS", "2"))
+ARTIST_PREWARM_MAX_PENDING = int(os.getenv("ARTIST_PREWARM_MAX_PENDING", "200"))
+# 검색 한 번에 미리 채울 최대 아티스트 수 (검색 결과 상위 아티스트부터)
+ARTIST_PREWARM_PER_SEARCH = int(os.getenv("ARTIST_PREWARM_PER_SEARCH", "3"))
+# 미리 채우기로 Spotify를 호출할 수 있는 초당 횟수와 최대 버스트 (예산을 넘으면 건너뜀)
+ARTIST_PREWARM_RATE = float(os.getenv("ARTIST_PREWARM_RATE", "1"))
+ARTIST_PREWARM_BURST = int(os.getenv("ARTIST_PREWARM_BURST", "5"))
 
-def load_genre_seeds():
-    """genre_seeds.json 파일로부터 장르 시드 목록과 가중치 매핑을 불러옴"""
-    try:
-        with open('genre_seeds.json', encoding='utf-8') as f:
-            data = json.load(f)
-        mapping = {}
-        for item in data.get("genres", []):
-            if isinstance(item, dict):
-                name = normalize_genre(item.get("name", ""))
-                weights = item.get("weights", {})
-                mapping[name] = weights
-            else:
-                mapping[normalize_genre(item)] = {
-                    "미식가": 0.5,
-                    "칠 가이": 0.5,
-                    "BGM 마스터": 0.3,
-                    "클러버": 0.3,
-                    "사운드 실험가": 0.3,
-                    "클래식 수호자": 0.3
-                }
-        return mapping
-    except Exception as e:
-        app.logger.exception("장르 시드 로드 실패")
-        return {}
+prewarm_executor = ThreadPoolExecutor(max_workers=ARTIST_PREWARM_WORKERS, thread_name_prefix="prewarm")
+prewarm_budget = TokenBucket(ARTIST_PREWARM_RATE, ARTIST_PREWARM_BURST)
+# 대기 중이거나 조회 중인 아티스트 ID (같은 아티스트를 중복으로 예약하지 않기 위함)
+_prewarm_pending = set()
+_prewarm_lock = threading.Lock()
 
-def load_tempo_expectations():
-    """genre_seeds.json 파일에서 각 장르의 템포 기대치를 추출하여 매핑"""
-    try:
-        with open('genre_seeds.json', encoding='utf-8') as f:
-            data = json.load(f)
-        tempo_mapping = {}
-        for item in data.get("genres", []):
-            if isinstance(item, dict):
-                name = normalize_genre(item.get("name", ""))
-                # "tempo" 키가 있으면 가져오고, 없으면 기본값 100 BPM 사용
-                tempo_mapping[name] = item.get("tempo", 100)
-        return tempo_mapping
-    except Exception as e:
-        app.logger.exception("템포 기대치 로드 실패")
-        return {}
-
-# JSON 파일에서 장르 시드와 템포 기대치를 불러옴
-GENRE_GROUP_WEIGHTS = load_genre_seeds()
-if not GENRE_GROUP_WEIGHTS:
-    GENRE_GROUP_WEIGHTS = {
-        "indie": {"칠 가이": 0.3, "미식가": 0.7, "BGM 마스터": 0.4},
-        "indie pop": {"칠 가이": 0.4, "미식가": 0.6, "BGM 마스터": 0.4},
-        "alternative": {"미식가": 0.4, "BGM 마스터": 0.6, "클러버": 0.2},
-        "experimental": {"사운드 실험가": 0.9, "미식가": 0.1, "칠 가이": 0.1},
-        "lo-fi": {"칠 가이": 0.8, "BGM 마스터": 0.4, "미식가": 0.2},
-        "ambient": {"칠 가이": 0.8, "BGM 마스터": 0.5},
-        "pop": {"BGM 마스터": 0.5, "클러버": 0.3, "미식가": 0.2},
-        "hip hop": {"클러버": 0.7, "사운드 실험가": 0.2},
-        "rap": {"클러버": 0.7, "사운드 실험가": 0.2},
-        "rock": {"클러버": 0.6, "미식가": 0.3, "BGM 마스터": 0.2},
-    }
+def prewarm_artist_top_tracks(artist_ids):
+    """
+    /search 결과에 나온 아티스트들의 인기곡을 백그라운드에서 캐시에 채워,
+    검색 직후의 아티스트 클릭(/artist_tracks)이 캐시에서 바로 응답되도록 합니다.
+    이미 캐시에 있는 아티스트는 제외하고 상위 ARTIST_PREWARM_PER_SEARCH명만 예약하며,
+    대기열이 가득 차면 새 예약은 건너뜁니다.
+    """
+    artist_ids = [aid for aid in dict.fromkeys(artist_ids) if aid]
+    # 미리 채우기용 조회는 캐시 히트/미스 통계에 반영하지 않음
+    cached = artist_top_tracks_cache.get_many(artist_ids, record=False)
+    artist_ids = [aid for aid in artist_ids if aid not in cached][:ARTIST_PREWARM_PER_SEARCH]
+    with _prewarm_lock:
+        artist_ids = [aid for aid in artist_ids if aid not in _prewarm_pending]
+        artist_ids = artist_ids[:max(0, ARTIST_PREWARM_MAX_PENDING - len(_prewarm_pending))]
+        _prewarm_pending.update(artist_ids)
+    if artist_ids:
+        prewarm_executor.submit(_prewarm_artist_top_tracks, artist_ids)
 
-TEMPO_EXPECTATIONS = load_tempo_expectations()
+def _prewarm_artist_top_tracks(artist_ids):
+    try:
+        # 미리 채우기용 조회는 캐시 히트/미스 통계에 반영하지 않음
+        cached = artist_top_tracks_cache.get_many(artist_ids, record=False)
+        for artist_id in artist_ids:
+            if artist_id in cached:
+                continue
+            # 호출 예산을 다 쓰면 나머지는 다음 검색 때 다시 예약되도록 건너뜀
+            if not prewarm_budget.try_acquire():
+                metrics.inc("artist_prewarm_skipped_total")
+                break
+            try:
+                fetch_artist_top_tracks(artist_id, cached=cached)
+            except Exception as e:
+                app.logger.exception(f"아티스트 인기곡 미리 채우기 실패: {artist_id}")
+    finally:
+        with _prewarm_lock:
+            _prewarm_pending.difference_update(artist_ids)
 
 #############################################
-# [수정] 기존 함수들: compute_tempo_score, get_lyrics_sentiment, compute_genre_group_scores
+# 분류 파이프라인 단계
+# (조회 → 트랙별 특징 → 사용자별 집계 → 그룹 점수 → 판정)
 #############################################
 
-def compute_tempo_score(genres):
-    """각 장르의 예상 BPM 값을 TEMPO_EXPECTATIONS에서 참조하여 평균 BPM을 계산한 후, 0~1 범위로 정규화하여 반환"""
-    tempos = []
-    for genre in genres:
-        norm_genre = normalize_genre(genre)
-        if norm_genre in TEMPO_EXPECTATIONS:
-            tempos.append(TEMPO_EXPECTATIONS[norm_genre])
-    if tempos:
-        avg_bpm = sum(tempos) / len(tempos)
-        # 예를 들어 BPM 범위를 60~140으로 가정하고 정규화 (실제 범위는 필요에 따라 조정)
-        normalized_tempo = (avg_bpm - 60) / (140 - 60)
-        return normalized_tempo
-    return 0.5
-
-def get_lyrics_sentiment(track_title, artist_name):
+@contextmanager
+def pipeline_stage(timings, name):
+    """단계 하나의 소요 시간을 지표 히스토그램에 기록하고, timings 딕셔너리가 있으면 ms 단위로 누적"""
+    started = time.perf_counter()
     try:
-        song = genius.search_song(track_title, artist_name)
-        if song and song.lyrics:
-            sentiment_scores = sentiment_analyzer.polarity_scores(song.lyrics)
-            return sentiment_scores["compound"]
-        return 0
-    except Exception as e:
-        app.logger.exception(f"가사 감성 분석 중 오류: {track_title} - {artist_name}")
-        return 0
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("classification_stage_duration_seconds", elapsed, stage=name)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed * 1000
 
-def compute_genre_group_scores(genres):
+@dataclass(frozen=True)
+class FetchedMetadata:
     """
-    입력된 장르 리스트를 순회하면서, 각 장르에 해당하는 그룹별 가중치를 누적한 후,
-    각 그룹별 평균 가중치를 딕셔너리로 반환합니다.
+    조회 단계 결과: 트랙 ID → 트랙 메타데이터, 대표 아티스트 ID → 정규화된 장르 리스트,
+    Spotify 장애로 트랙이나 대표 아티스트 정보를 가져오지 못한 트랙 ID (이 트랙이 포함된 결과는 캐시하지 않음)
+    """
+    track_map: Mapping[str, dict]
+    artist_genre_map: Mapping[str, list]
+    unresolved: frozenset = frozenset()
+
+@dataclass(frozen=True)
+class TrackFeatures:
+    """
+    트랙별 특징 배열 (행 하나가 트랙 하나, 메타데이터나 대표 아티스트 정보가 없는 트랙은 제외).
+    장르 정보가 없는 트랙은 has_genres가 False이고 group_scores 행은 0, tempo는 0입니다.
+    """
+    track_ids: tuple
+    index: Mapping[str, int]
+    popularity: np.ndarray
+    duration_ms: np.ndarray
+    explicit: np.ndarray
+    year: np.ndarray
+    decade_rows: np.ndarray
+    has_genres: np.ndarray
+    group_scores: np.ndarray
+    tempo: np.ndarray
+    genres: tuple
+    titles: tuple
+    artists: tuple
+
+    def rows(self, track_ids):
+        """특징이 있는 트랙만 골라 (트랙 ID 리스트, 행 번호 배열)로 반환 (입력 순서 유지)"""
+        valid_ids = [tid for tid in track_ids if tid in self.index]
+        return valid_ids, np.array([self.index[tid] for tid in valid_ids], dtype=np.intp)
+
+    def songs(self, rows):
+        """행 번호들의 (곡 제목, 아티스트) 리스트"""
+        return [(self.titles[row], self.artists[row]) for row in rows]
+
+@dataclass(frozen=True)
+class AggregateFeatures:
+    """사용자별 집계 지표 배열 (행 하나가 사용자 하나)"""
+    pop_mean: np.ndarray
+    dur_mean: np.ndarray
+    explicit_norm: np.ndarray
+    tempo_norm: np.ndarray
+    sentiment_norm: np.ndarray
+    avg_release_year_norm: np.ndarray
+    release_year_diversity: np.ndarray
+    genre_diversity_norm: np.ndarray
+    avg_genre_scores: np.ndarray
+    avg_decade_scores: np.ndarray
+
+def fetch_metadata(track_ids, on_tracks=None, cancel=None):
+    """
+    1단계: 트랙과 대표 아티스트의 메타데이터를 벌크 엔드포인트로 한꺼번에 조회
+    on_tracks(트랙 맵)는 트랙 조회 직후 호출되며, cancel(threading.Event)이 설정되어 있으면 아티스트 조회를 생략합니다.
     """
-    group_scores = {
-        "칠 가이": 0,
-        "미식가": 0,
-        "BGM 마스터": 0,
-        "클러버": 0,
-        "사운드 실험가": 0,
-        "클래식 수호자": 0
+    failed_tracks = []
+    track_map = fetch_tracks_bulk(track_ids, failed=failed_tracks)
+    if on_tracks:
+        on_tracks(track_map)
+    if cancel is not None and cancel.is_set():
+        return FetchedMetadata(track_map, {}, frozenset(failed_tracks))
+    failed_artists = []
+    artist_genre_map = fetch_artist_genres_bulk(
+        [get_primary_artist(t).get("id") for t in track_map.values()], failed=failed_artists
+    )
+    failed_artists = set(failed_artists)
+    unresolved = set(failed_tracks) | {
+        tid for tid, track in track_map.items() if get_primary_artist(track).get("id") in failed_artists
     }
-    total_keyword_matches = 0
-    for genre in genres:
-        norm_genre = normalize_genre(genre)
-        if norm_genre in GENRE_GROUP_WEIGHTS:
-            weights = GENRE_GROUP_WEIGHTS[norm_genre]
-            for group, weight in weights.items():
-                group_scores[group] += weight
-            total_keyword_matches += 1
-    if total_keyword_matches > 0:
-        for group in group_scores:
-            group_scores[group] /= total_keyword_matches
-    return group_scores
+    return FetchedMetadata(track_map, artist_genre_map, frozenset(unresolved))
+
+def extract_track_features(model, track_ids, metadata):
+    """
+    2단계: 트랙 메타데이터에서 분류에 필요한 값만 추려 TrackFeatures로 만듭니다.
+    장르 점수와 템포는 장르 정보가 있는 모든 트랙을 한 번에 계산합니다.
+    """
+    rows = []
+    for tid in dict.fromkeys(track_ids):
+        try:
+            track_detail = metadata.track_map.get(tid)
+            if track_detail is None:
+                raise ValueError("트랙 메타데이터 없음")
+            primary_artist = get_primary_artist(track_detail)
+            primary_artist_id = primary_artist.get("id")
+            if primary_artist_id and primary_artist_id not in metadata.artist_genre_map:
+                raise ValueError(f"아티스트 정보 없음: {primary_artist_id}")
+            
+            album = track_detail.get("album", {})
+            release_date = album.get("release_date", "2020")
+            year = int(release_date.split("-")[0])
+            rows.append((
+                tid,
+                track_detail.get("popularity", 0),
+                track_detail.get("duration_ms", 0),
+                1 if track_detail.get("explicit", False) else 0,
+                year,
+                # 대표 아티스트 ID가 없는 트랙은 장르 점수 없이 템포 0으로 계산
+                metadata.artist_genre_map[primary_artist_id] if primary_artist_id else None,
+                track_detail.get("name", ""),
+                primary_artist.get("name", ""),
+            ))
+        except Exception as e:
+            app.logger.exception(f"트랙 처리 중 오류 발생: {tid}")
+    
+    track_ids, popularity, duration_ms, explicit, years, genres, titles, artists = (
+        tuple(column) for column in zip(*rows)
+    ) if rows else ((),) * 8
+    has_genres = np.array([g is not None for g in genres], dtype=bool)
+    group_scores = np.zeros((len(rows), len(Group)))
+    tempo = np.zeros(len(rows))
+    if has_genres.any():
+        scores, tempos = model.score_genres([g for g in genres if g is not None])
+        group_scores[has_genres] = scores
+        tempo[has_genres] = tempos
+    return TrackFeatures(
+        track_ids=track_ids,
+        index=MappingProxyType({tid: row for row, tid in enumerate(track_ids)}),
+        popularity=np.array(popularity, dtype=float),
+        duration_ms=np.array(duration_ms, dtype=float),
+        explicit=np.array(explicit, dtype=float),
+        year=np.array(years, dtype=float),
+        decade_rows=np.array([model.decade_row(year) for year in years], dtype=np.intp),
+        has_genres=has_genres,
+        group_scores=group_scores,
+        tempo=tempo,
+        genres=genres,
+        titles=titles,
+        artists=artists,
+    )
+
+def _segment_sums(values, counts):
+    """사용자별로 이어 붙인 값 배열을 사용자 구간별로 합산 (구간 길이가 0이면 0)"""
+    sums = np.zeros((len(counts),) + values.shape[1:])
+    nonempty = counts > 0
+    if nonempty.any():
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums[nonempty] = np.add.reduceat(values, offsets[nonempty], axis=0)
+    return sums
+
+def _segment_mean_std(values, counts):
+    """사용자 구간별 평균과 (모)표준편차 (np.mean, np.std와 같은 순서로 계산)"""
+    nonempty = counts > 0
+    means = np.zeros(len(counts))
+    means[nonempty] = _segment_sums(values, counts)[nonempty] / counts[nonempty]
+    deviations = values - np.repeat(means, counts)
+    stds = np.zeros(len(counts))
+    stds[nonempty] = np.sqrt(_segment_sums(deviations * deviations, counts)[nonempty] / counts[nonempty])
+    return means, stds
+
+def aggregate_features(model, features, selections):
+    """
+    3단계: 사용자별 트랙 행 번호 배열과 감성 점수 배열 [(행 번호 배열, 감성 점수 배열), ...]을 받아 지표를 집계합니다.
+    사용자마다 트랙이 1개 이상이어야 하며, 모든 사용자의 트랙을 하나의 배열로 이어 붙여 사용자 구간별로 계산합니다.
+    """
+    counts = np.array([len(rows) for rows, _ in selections])
+    rows = np.concatenate([rows for rows, _ in selections])
+    
+    pop_norm = features.popularity[rows] / 100.0
+    dur_norm = np.clip((features.duration_ms[rows] - 60000) / 360000.0, 0, 1)
+    explicit = features.explicit[rows]
+    sentiment = np.concatenate([np.asarray(scores, dtype=float) for _, scores in selections])
+    tempo = features.tempo[rows]
+    release_year_norm = (features.year[rows] - 1950) / (2023 - 1950)
+    
+    avg_release_year_norm, release_year_diversity = _segment_mean_std(release_year_norm, counts)
+    
+    # 장르 다양성: 장르 정보가 있는 트랙의 그룹 평균 가중치(종합 지표)의 표준편차 (없으면 0.5)
+    has_genres = features.has_genres[rows]
+    group_rows = features.group_scores[rows]
+    genre_counts = np.add.reduceat(has_genres.astype(int), np.concatenate(([0], np.cumsum(counts)[:-1])))
+    _, genre_diversity = _segment_mean_std(group_rows[has_genres].mean(axis=1), genre_counts)
+    
+    return AggregateFeatures(
+        pop_mean=_segment_sums(pop_norm, counts) / counts,
+        dur_mean=_segment_sums(dur_norm, counts) / counts,
+        explicit_norm=_segment_sums(explicit, counts) / counts,
+        tempo_norm=_segment_sums(tempo, counts) / counts,
+        sentiment_norm=(_segment_sums(sentiment, counts) / counts + 1) / 2.0,
+        avg_release_year_norm=avg_release_year_norm,
+        release_year_diversity=release_year_diversity,
+        genre_diversity_norm=np.where(genre_counts > 0, np.clip(genre_diversity / 0.5, 0, 1), 0.5),
+        avg_genre_scores=_segment_sums(group_rows, counts) / counts[:, None],
+        avg_decade_scores=_segment_sums(model.decades[features.decade_rows[rows]], counts) / counts[:, None],
+    )
+
+def compute_group_scores(aggregate):
+    """4단계: 장르/데케이드 그룹 점수와 장르 다양성 보정을 합친 사용자×그룹 최종 점수 배열"""
+    alpha = 0.6
+    beta = 1.0  # 미식가 그룹에 대해 장르 다양성 반영 보정 상수
+    final_scores = alpha * aggregate.avg_genre_scores + (1 - alpha) * aggregate.avg_decade_scores
+    final_scores[:, Group.GOURMET] += beta * aggregate.genre_diversity_norm
+    return final_scores
+
+def decide_groups(aggregate, final_scores):
+    """
+    5단계: 사용자별 그룹 판정 (Group 값 배열).
+    위에서부터 처음으로 만족하는 조건의 그룹으로 판정하고, 모두 만족하지 않으면 최고 점수 그룹
+    """
+    pop_mean = aggregate.pop_mean
+    dur_mean = aggregate.dur_mean
+    explicit_norm = aggregate.explicit_norm
+    tempo_norm = aggregate.tempo_norm
+    genre_diversity_norm = aggregate.genre_diversity_norm
+    
+    predicted = np.argmax(final_scores, axis=1)
+    without_gourmet = final_scores.copy()
+    without_gourmet[:, Group.GOURMET] = -np.inf
+    predicted = np.where((predicted == Group.GOURMET) & (genre_diversity_norm < 0.2),
+                         np.argmax(without_gourmet, axis=1), predicted)
+    
+    return np.select(
+        [
+            (tempo_norm < 0.6) & (aggregate.sentiment_norm >= 0.2) & (final_scores[:, Group.CHILL_GUY] >= 0.25),
+            (pop_mean < 0.4) & (final_scores[:, Group.GOURMET] >= 0.3) & (genre_diversity_norm >= 0.4),
+            ((0.5 <= pop_mean) & (pop_mean <= 0.7) & (0.4 <= dur_mean) & (dur_mean <= 0.6)
+             & (0.45 <= tempo_norm) & (tempo_norm <= 0.55) & (explicit_norm < 0.1)
+             & (final_scores[:, Group.BGM_MASTER] >= 0.4)),
+            ((pop_mean >= 0.7) & (dur_mean < 0.4) & (tempo_norm >= 0.8) & (explicit_norm >= 0.3)
+             & (final_scores[:, Group.CLUBBER] >= 0.5)),
+            ((pop_mean < 0.4) & (tempo_norm >= 0.6) & (0.2 <= explicit_norm) & (explicit_norm <= 0.4)
+             & (final_scores[:, Group.SOUND_EXPLORER] >= 0.7)),
+            ((0.4 <= pop_mean) & (pop_mean <= 0.6) & (dur_mean >= 0.6) & (tempo_norm < 0.4) & (explicit_norm < 0.1)
+             & (aggregate.avg_release_year_norm < 0.3) & (aggregate.release_year_diversity < 0.2)
+             & (final_scores[:, Group.CLASSIC_GUARDIAN] >= 0.7)),
+        ],
+        [Group.CHILL_GUY, Group.GOURMET, Group.BGM_MASTER, Group.CLUBBER, Group.SOUND_EXPLORER, Group.CLASSIC_GUARDIAN],
+        default=predicted,
+    )
+
+def build_results(aggregate, final_scores, groups):
+    """판정 결과를 사용자별 {"group", "explanation", "analysisData"} 응답 딕셔너리로 변환"""
+    results = []
+    for i in range(len(groups)):
+        group = Group(int(groups[i])).label
+        avg_genre_group_scores = dict(zip(GROUP_NAMES, aggregate.avg_genre_scores[i].tolist()))
+        avg_decade_group_scores = dict(zip(GROUP_NAMES, aggregate.avg_decade_scores[i].tolist()))
+        final_group_scores = dict(zip(GROUP_NAMES, final_scores[i].tolist()))
+        explanation_details = (
+            f"(pop: {aggregate.pop_mean[i]:.2f}, dur: {aggregate.dur_mean[i]:.2f}, "
+            f"explicit: {aggregate.explicit_norm[i]:.2f}, tempo: {aggregate.tempo_norm[i]:.2f}, "
+            f"sentiment: {aggregate.sentiment_norm[i]:.2f}, "
+            f"release_year_avg: {aggregate.avg_release_year_norm[i]:.2f}, "
+            f"release_year_diversity: {aggregate.release_year_diversity[i]:.2f}, "
+            f"genre_diversity: {aggregate.genre_diversity_norm[i]:.2f}, 장르 그룹: {avg_genre_group_scores}, "
+            f"데케이드 그룹: {avg_decade_group_scores})"
+        )
+        explanation = f"당신의 음악 지표: {explanation_details}\n이 기준에 따라, 당신은 '{group}'으로 분류됩니다!"
+        # 분석에 사용된 수치 데이터
+        analysis_data = {
+            "popularity": float(aggregate.pop_mean[i]),
+            "duration": float(aggregate.dur_mean[i]),
+            "explicit": float(aggregate.explicit_norm[i]),
+            "tempo": float(aggregate.tempo_norm[i]),
+            "sentiment": float(aggregate.sentiment_norm[i]),
+            "release_year_avg": float(aggregate.avg_release_year_norm[i]),
+            "release_year_diversity": float(aggregate.release_year_diversity[i]),
+            "genre_diversity": float(aggregate.genre_diversity_norm[i]),
+            "genre_group_scores": avg_genre_group_scores,  # 예: {"칠 가이": 0.3, ...}
+            "decade_group_scores": avg_decade_group_scores,
+            "final_group_scores": final_group_scores          # 최종 계산된 그룹 점수
+        }
+        results.append({"group": group, "explanation": explanation, "analysisData": analysis_data})
+    return results
+
+def score_selections(model, features, selections, timings=None):
+    """
+    3~5단계를 차례로 실행해 여러 사용자의 선택 곡을 한 번에 분류합니다.
+    selections는 aggregate_features와 같은 [(행 번호 배열, 감성 점수 배열), ...] 형식이며,
+    timings 딕셔너리를 넘기면 단계별 소요 시간(ms)을 기록합니다.
+    반환: 사용자별 {"group", "explanation", "analysisData"} 딕셔너리 리스트
+    """
+    if not selections:
+        return []
+    with pipeline_stage(timings, "aggregate"):
+        aggregate = aggregate_features(model, features, selections)
+    with pipeline_stage(timings, "group_scores"):
+        final_scores = compute_group_scores(aggregate)
+    with pipeline_stage(timings, "decision"):
+        groups = decide_groups(aggregate, final_scores)
+        return build_results(aggregate, final_scores, groups)
 
 #############################################
 # Flask Routes & Endpoints
 #############################################
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_duration(exc=None):
+    """
+    라우트(URL 규칙)별 요청 처리 시간 기록 (/metrics 자신과 없는 경로는 제외).
+    처리되지 않은 예외로 after_request 없이 끝난 요청도 500으로 집계되도록 teardown에서 기록합니다.
+    """
+    rule = request.url_rule.rule if request.url_rule else None
+    if rule and rule != "/metrics" and "request_started" in g:
+        metrics.observe(
+            "http_request_duration_seconds", time.perf_counter() - g.request_started,
+            endpoint=rule, method=request.method, status=500 if exc is not None else g.get("response_status", 500)
+        )
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/search", methods=["GET"])
-def search():
-    query = request.args.get("q", "")
-    if not query:
-        return jsonify({"tracks": [], "artists": []})
-    
-    track_results = sp.search(q=query, type='track', limit=5)
-    track_items = track_results.get('tracks', {}).get('items', [])
+def fetch_search_results(query):
+    """Spotify에서 트랙/아티스트를 검색해 /search 응답 항목과 접두어 재사용에 필요한 정보를 만듭니다."""
+    # 트랙과 아티스트를 한 번의 요청으로 검색 (limit은 타입별로 적용되므로 따로 검색한 결과와 같음)
+    results = spotify_breaker.call(sp.search, q=query, type='track,artist', limit=SEARCH_LIMIT)
+    track_page = results.get('tracks', {})
+    track_items = track_page.get('items', [])
     tracks = []
+    track_texts = []
     for item in track_items:
-        album_images = item.get("album", {}).get("images", [])
-        album_image = album_images[0]["url"] if album_images else ""
-        tracks.append({
-            "id": item["id"],
-            "name": item["name"],
-            "artist": ", ".join([artist["name"] for artist in item["artists"]]),
-            "album_image": album_image,
-            "preview_url": item.get("preview_url")
-        })
+        tracks.append(format_track_item(item))
+        track_texts.append(fold_search_text(
+            " ".join([item["name"], tracks[-1]["artist"], item.get("album", {}).get("name", "")])
+        ))
     
-    artist_results = sp.search(q=query, type='artist', limit=5)
-    artist_items = artist_results.get('artists', {}).get('items', [])
+    artist_page = results.get('artists', {})
+    artist_items = artist_page.get('items', [])
     artists = []
     for item in artist_items:
         artist_images = item.get("images", [])
@@ -275,8 +2632,42 @@ def search():
             "image": artist_image
         })
     
-    app.logger.info("Search query: %s, Tracks: %d, Artists: %d", query, len(tracks), len(artists))
-    return jsonify({"tracks": tracks, "artists": artists})
+    return {
+        "tracks": tracks,
+        "artists": artists,
+        "track_texts": track_texts,
+        "artist_texts": [fold_search_text(item["name"]) for item in artist_items],
+        # 일치하는 항목이 모두 담긴 결과인지 (더 긴 검색어에 재사용 가능한지)
+        "complete": (track_page.get("total", len(track_items) + 1) <= len(track_items)
+                     and artist_page.get("total", len(artist_items) + 1) <= len(artist_items)),
+    }
+
+@app.route("/search", methods=["GET"])
+def search():
+    query = request.args.get("q", "")
+    normalized = normalize_search_query(query)
+    if not normalized:
+        return jsonify({"tracks": [], "artists": []})
+    
+    entry = lookup_search_cache(normalized)
+    if entry is None:
+        try:
+            entry = fetch_search_results(normalized)
+            search_cache.set(normalized, entry)
+        except Exception as e:
+            # Spotify 장애 시 만료되었지만 아직 남아 있는 같은 검색어의 결과로 대체
+            entry = search_cache.get(normalized, record=False, include_stale=True)
+            if entry is None and isinstance(e, CircuitOpenError):
+                return jsonify({"tracks": [], "artists": [], "error": "Spotify 검색을 일시적으로 사용할 수 없습니다."}), 503
+            if entry is None:
+                raise
+            app.logger.warning(f"Spotify 검색 실패, 만료된 캐시 사용: {normalized} ({e})")
+        else:
+            # 검색 결과의 아티스트를 클릭할 때를 대비해 인기곡을 미리 캐시 (새로 조회한 검색 결과일 때만)
+            prewarm_artist_top_tracks([artist["id"] for artist in entry["artists"]])
+    
+    app.logger.info("Search query: %s, Tracks: %d, Artists: %d", query, len(entry["tracks"]), len(entry["artists"]))
+    return jsonify({"tracks": entry["tracks"], "artists": entry["artists"]})
 
 @app.route("/artist_tracks", methods=["GET"])
 def artist_tracks():
@@ -284,207 +2675,313 @@ def artist_tracks():
     if not artist_id:
         return jsonify([])
     
-    top_tracks_data = sp.artist_top_tracks(artist_id, country='US')
-    track_items = top_tracks_data.get('tracks', [])
-    tracks = []
-    for item in track_items:
-        album_images = item.get("album", {}).get("images", [])
-        album_image = album_images[0]["url"] if album_images else ""
-        tracks.append({
-            "id": item["id"],
-            "name": item["name"],
-            "artist": ", ".join([artist["name"] for artist in item["artists"]]),
-            "album_image": album_image,
-            "preview_url": item.get("preview_url")
-        })
+    try:
+        tracks = fetch_artist_top_tracks(artist_id)
+    except CircuitOpenError:
+        return jsonify({"error": "Spotify 조회를 일시적으로 사용할 수 없습니다."}), 503
     return jsonify(tracks)
 
+def classify_selections(selections, lyrics_deadline=None, progress=None, cancel=None):
+    """
+    여러 사용자의 선택 곡(트랙 ID 리스트) 목록을 한 번에 분류해 사용자별 (응답 딕셔너리, HTTP 상태 코드)를 반환합니다.
+    사용자 간에 겹치는 트랙과 아티스트는 한 번만 조회하고, 파이프라인 단계를 모든 사용자에 대해 한꺼번에 실행합니다.
+    /mbti(run_classification), /mbti/batch, batch-classify가 모두 이 함수를 거칩니다.
+    
+    lyrics_deadline(time.monotonic 기준)이 있으면 분류 결과 캐시를 사용하고, 가사 조회가 마감 시간을
+    넘긴 트랙 ID를 analysisData.lyrics_timeouts에, Genius 오류로 중립값을 쓴 트랙 ID를 analysisData.lyrics_fallbacks에
+    담습니다. 이런 트랙이 있거나 Spotify 장애로 조회하지 못한 트랙이 있는 사용자의 결과는 캐시하지 않습니다.
+    lyrics_deadline이 없으면 캐시된 가사 감성 점수만 사용하고 캐시에 없는 곡은 중립값(0)으로 처리합니다.
+    progress(이벤트 이름, 데이터)를 넘기면 트랙별로 메타데이터 조회(metadata), 장르 확인(genres),
+    가사 분석(lyrics)이 끝날 때마다 호출되며, cancel(threading.Event)이 설정되면 남은 작업을 중단합니다.
+    """
+    def emit(event, data):
+        if progress:
+            progress(event, data)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def cancel_pending():
+        return [result or ({"group": "UNKNOWN", "explanation": "분류가 취소되었습니다."}, 499) for result in results]
+
+    # 선택된 곡은 집합으로 취급 (같은 곡을 여러 번 골라도 한 번만 반영)
+    selections = [list(dict.fromkeys(track_ids or [])) for track_ids in selections]
+    # 처리 중에 모델이 갱신되더라도 한 번의 호출 안에서는 같은 모델을 사용
+    model = get_scoring_model()
+    results = [None] * len(selections)
+    cache_keys = {}
+    for i, track_ids in enumerate(selections):
+        if not track_ids:
+            results[i] = ({"group": "UNKNOWN", "explanation": "선택된 곡이 없습니다."}, 200)
+        elif lyrics_deadline is not None:
+            cache_keys[i] = classification_cache_key(track_ids, model)
+            cached_result = classification_cache.get(cache_keys[i])
+            if cached_result is not None:
+                results[i] = (cached_result, 200)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    unique_ids = list(dict.fromkeys(tid for i in pending for tid in selections[i]))
+    
+    # 1단계: 트랙과 대표 아티스트의 메타데이터를 벌크 엔드포인트로 한꺼번에 조회
+    def on_tracks(track_map):
+        for tid in unique_ids:
+            track_detail = track_map.get(tid)
+            emit("metadata", {
+                "track_id": tid,
+                "found": track_detail is not None,
+                "name": track_detail.get("name", "") if track_detail else "",
+                "artist": get_primary_artist(track_detail).get("name", "") if track_detail else ""
+            })
+
+    timings = {}
+    with pipeline_stage(timings, "fetch"):
+        metadata = fetch_metadata(unique_ids, on_tracks=on_tracks if progress else None, cancel=cancel)
+    if cancelled():
+        return cancel_pending()
+    
+    # 2단계: 트랙별 특징 배열
+    with pipeline_stage(timings, "features"):
+        features = extract_track_features(model, unique_ids, metadata)
+    for tid, row in features.index.items():
+        emit("genres", {"track_id": tid, "genres": features.genres[row] or [], "tempo": float(features.tempo[row])})
+    if cancelled():
+        return cancel_pending()
+    
+    # 가사 감성 점수도 트랙 특징 행마다 한 번만 조회 (같은 곡을 가리키는 키는 get_lyrics_sentiments_bulk에서 합쳐짐)
+    all_rows = np.arange(len(features.track_ids))
+    timed_out_rows = set()
+    fallback_rows = set()
+    with pipeline_stage(timings, "lyrics"):
+        if lyrics_deadline is not None:
+            row_scores, timed_out, fallbacks = get_lyrics_sentiments_bulk(
+                features.songs(all_rows), lyrics_deadline,
+                on_score=lambda row, score: emit("lyrics", {"track_id": features.track_ids[row], "sentiment": score}),
+                cancel=cancel
+            )
+            if cancelled():
+                return cancel_pending()
+            timed_out_rows = set(timed_out)
+            for row in timed_out:
+                emit("lyrics", {"track_id": features.track_ids[row], "sentiment": 0, "timed_out": True})
+            if timed_out:
+                app.logger.warning("가사 감성 분석 마감 시간 초과: %s", [features.track_ids[row] for row in timed_out])
+            fallback_rows = set(fallbacks)
+        else:
+            keys = [lyrics_cache_key(title, artist) for title, artist in features.songs(all_rows)]
+            cached = lyrics_sentiment_cache.get_many(keys)
+            row_scores = [cached.get(key) or 0 for key in keys]
+    row_scores = np.array(row_scores, dtype=float)
+    
+    scorable = []
+    for i in pending:
+        valid_ids, rows = features.rows(selections[i])
+        if not valid_ids:
+            results[i] = ({"group": "UNKNOWN", "explanation": "트랙 메타데이터를 가져올 수 없습니다."}, 200)
+        else:
+            scorable.append((i, valid_ids, rows))
+    
+    # 3~5단계: 지표 집계, 그룹 점수, 판정
+    scored = score_selections(model, features, [(rows, row_scores[rows]) for _, _, rows in scorable], timings)
+    app.logger.debug("분류 단계별 소요 시간(ms): %s", timings)
+    for (i, valid_ids, rows), result in zip(scorable, scored):
+        if lyrics_deadline is not None:
+            # 마감 시간 내에 가사 분석을 끝내지 못했거나 Genius 오류로 중립값을 쓴 트랙 ID
+            lyrics_timeouts = [tid for tid, row in zip(valid_ids, rows) if row in timed_out_rows]
+            lyrics_fallbacks = [tid for tid, row in zip(valid_ids, rows) if row in fallback_rows]
+            result["analysisData"]["lyrics_timeouts"] = lyrics_timeouts
+            result["analysisData"]["lyrics_fallbacks"] = lyrics_fallbacks
+            # 모든 트랙의 메타데이터와 가사 점수를 제대로 얻은 결과만 캐시 (장애 중의 결과가 복구 후에도 남지 않도록)
+            if not lyrics_timeouts and not lyrics_fallbacks and metadata.unresolved.isdisjoint(selections[i]):
+                classification_cache.set(cache_keys[i], result)
+        results[i] = (result, 200)
+    return results
+
+def run_classification(track_ids, progress=None, cancel=None):
+    """
+    선택된 트랙 ID 목록으로 음악 취향을 분류해 (응답 딕셔너리, HTTP 상태 코드)를 반환합니다.
+    사용자 한 명에 대한 classify_selections이며, Flask 요청 컨텍스트가 필요 없으므로 백그라운드 작업에서도 그대로 호출할 수 있습니다.
+    """
+    try:
+        lyrics_deadline = time.monotonic() + LYRICS_DEADLINE_SECONDS
+        return classify_selections([track_ids], lyrics_deadline, progress=progress, cancel=cancel)[0]
+    except Exception as e:
+        app.logger.exception("음악 취향 분류 중 오류 발생")
+        return {"group": "UNKNOWN", "explanation": "분류에 실패했습니다."}, 500
+
+def run_classification_job(job_id, track_ids):
+    """백그라운드 실행기에서 분류를 수행하고 결과를 작업 저장소에 기록"""
+    try:
+        mbti_jobs.update(job_id, "running")
+        payload, status_code = run_classification(track_ids)
+        mbti_jobs.update(job_id, "done" if status_code == 200 else "failed", payload, status_code)
+    except Exception as e:
+        app.logger.exception(f"비동기 분류 작업 처리 중 오류 발생: {job_id}")
+
 @app.route("/mbti", methods=["POST"])
 def classify_music_taste():
     try:
         data = request.get_json()
         track_ids = data.get("track_ids", [])
-        if not track_ids or len(track_ids) == 0:
-            return jsonify({"group": "UNKNOWN", "explanation": "선택된 곡이 없습니다."})
-        
-        pop_list = []
-        dur_list = []
-        explicit_list = []
-        sentiment_list = []
-        tempo_list = []
-        release_year_list = []
-        genre_scores = []
-        
-        total_genre_group_scores = {
-            "칠 가이": 0,
-            "미식가": 0,
-            "BGM 마스터": 0,
-            "클러버": 0,
-            "사운드 실험가": 0,
-            "클래식 수호자": 0
-        }
-        total_decade_group_scores = {
-            "칠 가이": 0,
-            "미식가": 0,
-            "BGM 마스터": 0,
-            "클러버": 0,
-            "사운드 실험가": 0,
-            "클래식 수호자": 0
-        }
-        
-        valid_tracks = 0
-        artist_genre_cache = {}
-        
-        for tid in track_ids:
-            try:
-                track_detail = sp.track(tid)
-                pop_list.append(track_detail.get("popularity", 0))
-                dur_list.append(track_detail.get("duration_ms", 0))
-                explicit_list.append(1 if track_detail.get("explicit", False) else 0)
-                
-                album = track_detail.get("album", {})
-                release_date = album.get("release_date", "2020")
-                year = int(release_date.split("-")[0])
-                release_year_list.append(year)
-                decade = f"{(year // 10) * 10}s"
-                if decade not in DECADE_GROUP_WEIGHTS:
-                    decade = "2000s"
-                decade_weights = DECADE_GROUP_WEIGHTS[decade]
-                for group, weight in decade_weights.items():
-                    total_decade_group_scores[group] += weight
-                
-                artists = track_detail.get("artists", [])
-                primary_artist_name = ""
-                genres = []
-                tempo_score = 0
-                if artists:
-                    primary_artist = artists[0]
-                    primary_artist_id = primary_artist.get("id")
-                    primary_artist_name = primary_artist.get("name", "")
-                    if primary_artist_id:
-                        if primary_artist_id in artist_genre_cache:
-                            genres = artist_genre_cache[primary_artist_id]
-                        else:
-                            artist_detail = sp.artist(primary_artist_id)
-                            genres = artist_detail.get("genres", [])
-                            genres = [normalize_genre(g) for g in genres]
-                            artist_genre_cache[primary_artist_id] = genres
-                        group_scores = compute_genre_group_scores(genres)
-                        # genre_scores에 각 그룹별 평균 가중치의 단순 평균 값을 저장 (종합 지표로 활용)
-                        genre_scores.append(np.mean(list(group_scores.values())))
-                        tempo_score = compute_tempo_score(genres)
-                        for group in total_genre_group_scores:
-                            total_genre_group_scores[group] += group_scores.get(group, 0)
-                tempo_list.append(tempo_score)
-                
-                track_title = track_detail.get("name", "")
-                lyrics_sentiment = get_lyrics_sentiment(track_title, primary_artist_name)
-                sentiment_list.append(lyrics_sentiment)
-                
-                valid_tracks += 1
-            except Exception as e:
-                app.logger.exception(f"트랙 처리 중 오류 발생: {tid}")
-                continue
-        
-        if valid_tracks == 0:
-            return jsonify({"group": "UNKNOWN", "explanation": "트랙 메타데이터를 가져올 수 없습니다."})
-        
-        pop_arr = np.array(pop_list)
-        dur_arr = np.array(dur_list)
-        explicit_arr = np.array(explicit_list)
-        sentiment_arr = np.array(sentiment_list)
-        tempo_arr = np.array(tempo_list)
-        
-        if release_year_list:
-            release_year_arr = np.array(release_year_list)
-            release_year_norm = (release_year_arr - 1950) / (2023 - 1950)
-            avg_release_year_norm = release_year_norm.mean()
-            release_year_diversity = np.std(release_year_norm)
-        else:
-            avg_release_year_norm = 0.5
-            release_year_diversity = 0.5
-        
-        pop_norm = pop_arr / 100.0
-        dur_norm = np.clip((dur_arr - 60000) / 360000.0, 0, 1)
-        explicit_norm = explicit_arr.mean()
-        sentiment_norm = ((sentiment_arr.mean()) + 1) / 2.0
-        tempo_norm = tempo_arr.mean()
-        
-        if genre_scores:
-            genre_diversity = np.std(genre_scores)
-            genre_diversity_norm = np.clip(genre_diversity / 0.5, 0, 1)
-        else:
-            genre_diversity_norm = 0.5
-        
-        avg_genre_group_scores = {group: total_genre_group_scores[group] / valid_tracks 
-                                  for group in total_genre_group_scores}
-        avg_decade_group_scores = {group: total_decade_group_scores[group] / valid_tracks 
-                                  for group in total_decade_group_scores}
-        
-        alpha = 0.6
-        beta = 1.0  # 미식가 그룹에 대해 장르 다양성 반영 보정 상수
-        final_group_scores = {}
-        for group in total_genre_group_scores:
-            score = alpha * avg_genre_group_scores[group] + (1 - alpha) * avg_decade_group_scores[group]
-            if group == "미식가":
-                score += beta * genre_diversity_norm
-            final_group_scores[group] = score
+        # 비동기 모드: {"async": true} 또는 ?async=1 이면 작업 ID만 즉시 반환
+        run_async = bool(data.get("async")) or request.args.get("async", "").lower() in ("1", "true")
+    except Exception as e:
+        app.logger.exception("음악 취향 분류 중 오류 발생")
+        return jsonify({"group": "UNKNOWN", "explanation": "분류에 실패했습니다."}), 500
+    
+    if run_async:
+        job_id = mbti_jobs.create()
+        try:
+            mbti_job_executor.submit(run_classification_job, job_id, track_ids)
+        except ExecutorBusyError:
+            payload = {"group": "UNKNOWN", "explanation": "요청이 많아 지금은 분류할 수 없습니다. 잠시 후 다시 시도해 주세요."}
+            mbti_jobs.update(job_id, "failed", payload, 503)
+            return jsonify({"job_id": job_id, "status": "failed", **payload}), 503
+        return jsonify({
+            "job_id": job_id,
+            "status": "pending",
+            "result_url": url_for("mbti_job_result", job_id=job_id)
+        }), 202
+    
+    payload, status_code = run_classification(track_ids)
+    return jsonify(payload), status_code
+
+# /mbti/batch 한 번에 받을 최대 사용자 수와 사용자당 최대 트랙 수
+MBTI_BATCH_MAX_USERS = int(os.getenv("MBTI_BATCH_MAX_USERS", "500"))
+MBTI_BATCH_MAX_TRACKS = int(os.getenv("MBTI_BATCH_MAX_TRACKS", "100"))
+
+@app.route("/mbti/batch", methods=["POST"])
+def classify_music_taste_batch():
+    """
+    여러 사용자의 음악 취향을 한 번에 분류하는 엔드포인트.
+    요청: {"users": [{"user": "...", "track_ids": ["...", ...]}, ...]}
+    응답: {"results": [{"user": "...", "status": 200, "group": "...", "explanation": "...", "analysisData": {...}}, ...]}
+    사용자 간에 겹치는 트랙/아티스트/가사는 한 번만 조회하고 그룹 판정은 사용자×지표 배열로 한꺼번에 계산합니다.
+    결과는 요청 순서대로 반환하며, 형식이 잘못된 항목은 status 400으로 표시하고 나머지는 그대로 분류합니다.
+    """
+    try:
+        users = (request.get_json(silent=True) or {}).get("users")
+        if not isinstance(users, list):
+            return jsonify({"error": "users는 리스트여야 합니다."}), 400
+        if len(users) > MBTI_BATCH_MAX_USERS:
+            return jsonify({"error": f"한 번에 최대 {MBTI_BATCH_MAX_USERS}명까지 분류할 수 있습니다."}), 413
         
-        predicted_group = max(final_group_scores, key=final_group_scores.get)
-        if predicted_group == "미식가" and genre_diversity_norm < 0.2:
-            filtered_scores = {g: s for g, s in final_group_scores.items() if g != "미식가"}
-            predicted_group = max(filtered_scores, key=filtered_scores.get)
+        results = [None] * len(users)
+        valid = []
+        for i, entry in enumerate(users):
+            user = entry.get("user") if isinstance(entry, dict) else None
+            track_ids = entry.get("track_ids", []) if isinstance(entry, dict) else None
+            if not isinstance(track_ids, list) or not all(isinstance(tid, str) for tid in track_ids):
+                results[i] = {"user": user, "status": 400, "group": "UNKNOWN", "explanation": "track_ids는 문자열 리스트여야 합니다."}
+            elif len(track_ids) > MBTI_BATCH_MAX_TRACKS:
+                results[i] = {"user": user, "status": 400, "group": "UNKNOWN",
+                              "explanation": f"사용자당 최대 {MBTI_BATCH_MAX_TRACKS}곡까지 분류할 수 있습니다."}
+            else:
+                valid.append((i, user, track_ids))
         
-        group = "기타"
-        explanation_details = (
-            f"(pop: {pop_norm.mean():.2f}, dur: {dur_norm.mean():.2f}, "
-            f"explicit: {explicit_norm:.2f}, tempo: {tempo_norm:.2f}, sentiment: {sentiment_norm:.2f}, "
-            f"release_year_avg: {avg_release_year_norm:.2f}, release_year_diversity: {release_year_diversity:.2f}, "
-            f"genre_diversity: {genre_diversity_norm:.2f}, 장르 그룹: {avg_genre_group_scores}, "
-            f"데케이드 그룹: {avg_decade_group_scores})"
+        classified = classify_selections(
+            [track_ids for _, _, track_ids in valid], lyrics_deadline=time.monotonic() + LYRICS_DEADLINE_SECONDS
         )
-        
-        if tempo_norm < 0.6 and sentiment_norm >= 0.2 and final_group_scores.get("칠 가이", 0) >= 0.25:
-            group = "칠 가이"
-        elif pop_norm.mean() < 0.4 and final_group_scores.get("미식가", 0) >= 0.3 and genre_diversity_norm >= 0.4:
-            group = "미식가"
-        elif (0.5 <= pop_norm.mean() <= 0.7 and 0.4 <= dur_norm.mean() <= 0.6 and 0.45 <= tempo_norm <= 0.55 
-              and explicit_norm < 0.1 and final_group_scores.get("BGM 마스터", 0) >= 0.4):
-            group = "BGM 마스터"
-        elif pop_norm.mean() >= 0.7 and dur_norm.mean() < 0.4 and tempo_norm >= 0.8 and explicit_norm >= 0.3 and final_group_scores.get("클러버", 0) >= 0.5:
-            group = "클러버"
-        elif pop_norm.mean() < 0.4 and tempo_norm >= 0.6 and 0.2 <= explicit_norm <= 0.4 and final_group_scores.get("사운드 실험가", 0) >= 0.7:
-            group = "사운드 실험가"
-        elif (0.4 <= pop_norm.mean() <= 0.6 and dur_norm.mean() >= 0.6 and tempo_norm < 0.4 and explicit_norm < 0.1 and 
-              avg_release_year_norm < 0.3 and release_year_diversity < 0.2 and final_group_scores.get("클래식 수호자", 0) >= 0.7):
-            group = "클래식 수호자"
-        else:
-            group = predicted_group
-        
-        explanation = f"당신의 음악 지표: {explanation_details}\n이 기준에 따라, 당신은 '{group}'으로 분류됩니다!"
-        # 추가: 분석에 사용된 수치 데이터를 딕셔너리로 구성
-        analysis_data = {
-            "popularity": float(pop_norm.mean()),
-            "duration": float(dur_norm.mean()),
-            "explicit": float(explicit_norm),
-            "tempo": float(tempo_norm),
-            "sentiment": float(sentiment_norm),
-            "release_year_avg": float(avg_release_year_norm),
-            "release_year_diversity": float(release_year_diversity),
-            "genre_diversity": float(genre_diversity_norm),
-            "genre_group_scores": avg_genre_group_scores,  # 예: {"칠 가이": 0.3, ...}
-            "decade_group_scores": avg_decade_group_scores,
-            "final_group_scores": final_group_scores          # 최종 계산된 그룹 점수
-        }
-
-        return jsonify({
-            "group": group,
-            "explanation": explanation,
-            "analysisData": analysis_data
-        })
+        for (i, user, _), (payload, status_code) in zip(valid, classified):
+            results[i] = {"user": user, "status": status_code, **payload}
+        return jsonify({"results": results}), 200
     except Exception as e:
-        app.logger.exception("음악 취향 분류 중 오류 발생")
-        return jsonify({"group": "UNKNOWN", "explanation": "분류에 실패했습니다."}), 500
+        app.logger.exception("일괄 음악 취향 분류 중 오류 발생")
+        return jsonify({"error": "분류에 실패했습니다."}), 500
+
+def format_sse(event, data):
+    """Server-Sent Events 형식의 메시지 문자열 생성"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 진행 이벤트가 없을 때 연결 유지를 위해 주석을 보내는 간격(초)
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.route("/mbti/stream", methods=["GET"])
+def classify_music_taste_stream():
+    """
+    분류 진행 상황을 Server-Sent Events로 전송하는 엔드포인트.
+    ?track_ids=a,b,c (또는 track_ids 반복) 형태로 트랙을 받아, 트랙별 metadata/genres/lyrics 이벤트와
+    최종 분류 결과가 담긴 result 이벤트를 보냅니다. 클라이언트가 연결을 끊으면 남은 작업을 중단합니다.
+    """
+    track_ids = [tid for value in request.args.getlist("track_ids") for tid in value.split(",") if tid]
+    events = queue.Queue()
+    cancel = threading.Event()
+
+    def worker():
+        try:
+            payload, status_code = run_classification(
+                track_ids, progress=lambda event, data: events.put((event, data)), cancel=cancel
+            )
+            events.put(("result", {**payload, "status": status_code}))
+        finally:
+            events.put(None)
+
+    try:
+        mbti_stream_executor.submit(worker)
+    except ExecutorBusyError:
+        return jsonify({"group": "UNKNOWN", "explanation": "요청이 많아 지금은 분류할 수 없습니다. 잠시 후 다시 시도해 주세요."}), 503
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield format_sse(*item)
+        finally:
+            # 클라이언트 연결이 끊겨 제너레이터가 닫히면 백그라운드 분류도 중단
+            cancel.set()
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/mbti/<job_id>", methods=["GET"])
+def mbti_job_result(job_id):
+    """비동기 분류 작업의 상태 또는 최종 결과(group/explanation/analysisData)를 반환"""
+    job = mbti_jobs.get(job_id)
+    if job is None:
+        return jsonify({"job_id": job_id, "status": "not_found"}), 404
+    if job["status"] in ("pending", "running"):
+        return jsonify({"job_id": job_id, "status": job["status"]}), 202
+    return jsonify({"job_id": job_id, "status": job["status"], **job["result"]}), job["http_status"]
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """모든 워커의 지표를 합산해 Prometheus 텍스트 형식으로 반환"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """캐시 히트/미스 등 운영 지표를 JSON으로 반환"""
+    return jsonify({
+        "artist_genre_cache": artist_genre_cache.stats(),
+        "lyrics_sentiment_cache": lyrics_sentiment_cache.stats(),
+        "lyrics_corpus": lyrics_corpus.stats() if lyrics_corpus else None,
+        "artist_top_tracks_cache": artist_top_tracks_cache.stats(),
+        "track_metadata_cache": track_metadata_cache.stats(),
+        "classification_cache": classification_cache.stats(),
+        "search_cache": {**search_cache.stats(), "prefix_hits": search_prefix_hits},
+        "single_flight": {"spotify": spotify_flight.stats(), "lyrics": lyrics_flight.stats()},
+        "startup_phases_ms": STARTUP_PHASES,
+        "process_memory_kb": process_memory(),
+        "spotify_token": {
+            "expires_in": round(((spotify_token_cache.get_cached_token() or {}).get("expires_at", 0)) - time.time()),
+            "refreshes": spotify_token_cache.refreshes,
+        },
+        "circuit_breakers": {"spotify": spotify_breaker.stats(), "genius": genius_breaker.stats()},
+        "genius_rate_limiter": genius_rate_limiter.stats(),
+        "job_executors": {"async": mbti_job_executor.stats(), "stream": mbti_stream_executor.stats()},
+        "http_pools": {
+            "spotify": http_pool_stats(spotify_session),
+            "genius_api": http_pool_stats(genius_api_session),
+            "genius_web": http_pool_stats(genius_web_session),
+        },
+    })
 
 @app.route("/result", methods=["GET"])
 def result():
@@ -501,5 +2998,236 @@ def result():
     image_url = images.get(group, "static/images/default.png")
     return render_template("result.html", group=group, explanation=explanation, image_url=image_url)
 
+#############################################
+# 오프라인 일괄 분류 (flask batch-classify)
+#############################################
+
+@app.cli.command("batch-classify")
+@click.argument("input_file", type=click.File("r", encoding="utf-8"))
+@click.argument("output_file", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--chunk-size", default=1000, show_default=True, help="한 번에 조회/분류할 사용자 수")
+@click.option("--fetch-lyrics/--cached-lyrics", default=False, show_default=True,
+              help="캐시에 없는 가사를 Genius에서 조회할지 여부 (기본: 캐시된 점수만 사용, 없으면 중립값)")
+@click.option("--lyrics-deadline", default=600.0, show_default=True, help="묶음 하나당 가사 조회 최대 대기 시간(초)")
+def batch_classify_command(input_file, output_file, chunk_size, fetch_lyrics, lyrics_deadline):
+    """
+    JSONL 파일의 사용자별 선택 곡을 일괄 분류합니다.
+    입력 한 줄: {"user": "...", "track_ids": ["...", ...]}
+    출력 한 줄: {"user": "...", "status": 200, "group": "...", "explanation": "...", "analysisData": {...}}
+    형식이 잘못된 줄은 {"line": 줄 번호, "error": "..."}로 기록하고 계속 진행합니다.
+    """
+    def flush(chunk):
+        # 형식 오류 줄도 입력 순서대로 기록되도록 묶음 단위로 함께 출력
+        valid = [(user, track_ids) for _, user, track_ids, error in chunk if error is None]
+        deadline = time.monotonic() + lyrics_deadline if fetch_lyrics else None
+        try:
+            results = iter(classify_selections([track_ids for _, track_ids in valid], lyrics_deadline=deadline))
+        except Exception as e:
+            app.logger.exception("일괄 분류 중 오류 발생")
+            results = iter([({"group": "UNKNOWN", "explanation": "분류에 실패했습니다."}, 500)] * len(valid))
+        for line_no, user, _, error in chunk:
+            if error is not None:
+                record = {"line": line_no, "error": error}
+            else:
+                payload, status = next(results)
+                record = {"user": user, "status": status, **payload}
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output_file.flush()
+
+    started = time.monotonic()
+    users = 0
+    chunk = []
+    for line_no, line in enumerate(input_file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            track_ids = record["track_ids"]
+            if not isinstance(track_ids, list):
+                raise ValueError("track_ids는 리스트여야 합니다.")
+            chunk.append((line_no, record.get("user"), track_ids, None))
+            users += 1
+        except Exception as e:
+            chunk.append((line_no, None, None, str(e)))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    click.echo(f"{users}명 분류 완료 ({time.monotonic() - started:.1f}초)", err=True)
+
+def load_lyrics_corpus(path):
+    """벤치마크용 가사 모음 불러오기: .txt 파일이 든 디렉터리 또는 {"lyrics": "..."} 줄로 된 JSONL 파일"""
+    if os.path.isdir(path):
+        texts = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".txt"):
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    texts.append(f.read())
+        return texts
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["lyrics"] for line in f if line.strip()]
+
+@app.cli.command("sentiment-benchmark")
+@click.argument("corpus", type=click.Path(exists=True))
+@click.option("--repeat", default=1, show_default=True, help="모음 전체를 반복 채점할 횟수")
+def sentiment_benchmark_command(corpus, repeat):
+    """
+    가사 모음으로 기존 VADER(polarity_scores)와 가사 전용 엔진의 속도와 점수 차이를 비교합니다.
+    구간 표시를 남긴 원문 기준 차이는 반올림 오차(1e-4) 이내여야 합니다.
+    """
+    texts = load_lyrics_corpus(corpus)
+    if not texts:
+        raise click.ClickException("가사가 없습니다.")
+    analyzer = get_sentiment_analyzer()
+    engine = get_sentiment_engine()
+
+    def timed(score):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            scores = [score(text) for text in texts]
+        return scores, time.perf_counter() - started
+
+    stock, stock_seconds = timed(lambda text: analyzer.polarity_scores(text)["compound"])
+    raw, raw_seconds = timed(lambda text: engine.compound(text, strip_sections=False))
+    stripped, stripped_seconds = timed(engine.compound)
+    raw_diff = max(abs(a - b) for a, b in zip(stock, raw))
+    stripped_diff = max(abs(a - b) for a, b in zip(stock, stripped))
+    total = len(texts) * repeat
+    click.echo(f"가사 {len(texts)}곡 x {repeat}회")
+    click.echo(f"기존 VADER:           {stock_seconds:.3f}초 ({stock_seconds / total * 1000:.3f} ms/곡)")
+    click.echo(f"가사 엔진 (원문):     {raw_seconds:.3f}초 ({raw_seconds / total * 1000:.3f} ms/곡, "
+               f"{stock_seconds / raw_seconds:.1f}배), 최대 차이 {raw_diff:.4f}")
+    click.echo(f"가사 엔진 (구간 제거): {stripped_seconds:.3f}초 ({stripped_seconds / total * 1000:.3f} ms/곡, "
+               f"{stock_seconds / stripped_seconds:.1f}배), 최대 차이 {stripped_diff:.4f} (참고용)")
+    if raw_diff > 1e-4:
+        raise click.ClickException(f"원문 기준 점수 차이가 허용 오차를 넘었습니다: {raw_diff}")
+
+def rescore_lyrics_chunk(rows, strip_sections=True):
+    """(곡 ID, 압축된 가사) 묶음을 채점해 (곡 ID, compound 점수) 리스트로 반환 (프로세스 풀 작업 단위)"""
+    engine = get_sentiment_engine()
+    return [
+        (song_id, engine.compound(zlib.decompress(blob).decode("utf-8"), strip_sections=strip_sections))
+        for song_id, blob in rows
+    ]
+
+@app.cli.command("rescore-lyrics")
+@click.option("--workers", default=os.cpu_count() or 1, show_default="CPU 코어 수", help="채점 프로세스 수")
+@click.option("--chunk-size", default=500, show_default=True, help="프로세스 하나에 한 번에 넘길 곡 수")
+@click.option("--strip-sections/--keep-sections", default=True, show_default=True, help="[Chorus] 등 구간 표시 줄 제거 여부")
+@click.option("--dry-run", is_flag=True, help="점수 캐시를 갱신하지 않고 바뀔 항목 수만 출력")
+def rescore_lyrics_command(workers, chunk_size, strip_sections, dry_run):
+    """
+    보관된 가사 원문 전체를 여러 프로세스에서 다시 채점해 가사 감성 점수 캐시를 갱신합니다.
+    Genius를 호출하지 않으므로 감성 계산 방식을 바꾼 뒤 기존 곡 점수를 한 번에 다시 맞출 때 사용합니다.
+    """
+    if lyrics_corpus is None:
+        raise click.ClickException("LYRICS_CORPUS_DB가 비어 있어 가사 원문 보관소가 꺼져 있습니다.")
+    # VADER 사전이 없으면 프로세스를 띄우기 전에 바로 실패하도록 먼저 불러 봄
+    get_sentiment_engine()
+    # 토큰 갱신/지표 기록 스레드가 도는 프로세스를 fork하지 않도록 spawn으로 새 인터프리터를 띄우고,
+    # 자식 프로세스는 앱을 불러올 때 백그라운드 스레드를 시작하지 않게 함 (spawn 자식은 환경 변수를 물려받음)
+    os.environ["APP_DEFER_BACKGROUND_THREADS"] = "1"
+    mp_context = multiprocessing.get_context("spawn")
+    started = time.monotonic()
+    songs = keys = changed = 0
+
+    def apply(future):
+        nonlocal songs, keys, changed
+        scores = dict(future.result())
+        keys_by_song = lyrics_corpus.keys_for(scores)
+        updates = {key: scores[song_id] for song_id, song_keys in keys_by_song.items() for key in song_keys}
+        cached = lyrics_sentiment_cache.get_many(updates, record=False)
+        changed += sum(1 for key, score in updates.items() if cached.get(key) != score)
+        if not dry_run:
+            lyrics_sentiment_cache.set_many(updates)
+        songs += len(scores)
+        keys += len(updates)
+
+    # 압축된 가사 묶음이 한꺼번에 메모리에 쌓이지 않도록 동시에 넘기는 묶음 수를 프로세스 수의 2배로 제한
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        in_flight = set()
+        for rows in lyrics_corpus.iter_compressed(chunk_size):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    apply(future)
+            in_flight.add(executor.submit(rescore_lyrics_chunk, rows, strip_sections))
+        for future in wait(in_flight).done:
+            apply(future)
+    click.echo(
+        f"{songs}곡 채점, 캐시 키 {keys}개 중 {changed}개 점수 변경{' (dry run)' if dry_run else ''} "
+        f"({time.monotonic() - started:.1f}초, 프로세스 {workers}개)",
+        err=True,
+    )
+
+#############################################
+# 백그라운드 스레드와 fork 이후 재초기화 (gunicorn preload)
+#############################################
+
+def start_background_threads():
+    """워커에서 돌아야 하는 백그라운드 스레드 시작 (Spotify 토큰은 부팅을 막지 않도록 여기서 발급/갱신)"""
+    start_token_refresher()
+    start_metrics_flusher()
+
+def warm_shared_state():
+    """
+    preload 모드에서 마스터가 fork 전에 불러 둘 읽기 전용 데이터.
+    점수 모델과 VADER 사전을 여기서 만들어 두면 워커들이 copy-on-write로 같은 메모리를 공유합니다.
+    """
+    get_scoring_model()
+    require_sentiment_lexicon()
+
+def reinit_after_fork():
+    """
+    fork된 자식 프로세스에서 부모와 공유하면 안 되는 자원을 새로 만듭니다.
+    HTTP 연결 풀은 비우고(부모의 소켓/TLS 상태를 재사용하지 않도록), 스레드 풀은 새로 만들고,
+    부모의 스레드가 잡고 있었을 수 있는 토큰 캐시 잠금은 교체하고, 부모가 모은 지표 값은 버립니다.
+    (SQLite 커넥션은 프로세스별로 다시 연결됨)
+    """
+    global lyrics_executor, mbti_job_executor, mbti_stream_executor, prewarm_executor, _token_refresher, _metrics_flusher
+    for session in (spotify_session, genius_api_session, genius_web_session):
+        session.close()
+    lyrics_executor = ThreadPoolExecutor(max_workers=LYRICS_MAX_WORKERS, thread_name_prefix="lyrics")
+    mbti_job_executor = BoundedExecutor(MBTI_JOB_WORKERS, MBTI_JOB_MAX_QUEUED, thread_name_prefix="mbti-job")
+    mbti_stream_executor = BoundedExecutor(MBTI_STREAM_WORKERS, MBTI_STREAM_MAX_QUEUED, thread_name_prefix="mbti-stream")
+    prewarm_executor = ThreadPoolExecutor(max_workers=ARTIST_PREWARM_WORKERS, thread_name_prefix="prewarm")
+    spotify_token_cache._thread_lock = threading.Lock()
+    _token_refresher = None
+    metrics.reset()
+    _metrics_flusher = None
+
+def process_memory():
+    """
+    현재 프로세스의 메모리 사용량(KB). Linux에서는 smaps_rollup의 Pss/Shared/Private 값으로
+    preload 시 워커 간에 공유되는 메모리를 확인할 수 있습니다. 지원하지 않는 환경에서는 빈 딕셔너리.
+    """
+    fields = {"Rss": "rss_kb", "Pss": "pss_kb", "Shared_Clean": "shared_clean_kb", "Shared_Dirty": "shared_dirty_kb",
+              "Private_Clean": "private_clean_kb", "Private_Dirty": "private_dirty_kb"}
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reinit_after_fork)
+
+# gunicorn preload 모드에서는 마스터에 스레드를 두지 않고 fork 이후 워커(post_fork)에서 시작
+if os.getenv("APP_DEFER_BACKGROUND_THREADS") != "1":
+    start_background_threads()
+
+mark_startup_phase("caches_and_routes")
+app.logger.info(
+    "앱 초기화 완료: %.1fms %s", (time.perf_counter() - _startup_started) * 1000, STARTUP_PHASES
+)
+
 if __name__ == "__main__":
+    require_sentiment_lexicon()
     app.run(debug=True)
@@ -0,0 +1,69 @@
+"""
+gunicorn 설정 (Procfile: gunicorn -c gunicorn.conf.py app:app)
+
+preload_app이 켜져 있으면 마스터가 앱을 한 번만 불러와 점수 모델과 VADER 사전을 만든 뒤 fork하므로,
+워커마다 NumPy/NLTK/lyricsgenius를 다시 불러오지 않고 읽기 전용 데이터를 copy-on-write로 공유합니다.
+HTTP 연결 풀, 스레드 풀, 백그라운드 스레드는 fork 이후 워커에서 새로 만듭니다.
+GUNICORN_PRELOAD=0으로 끄면 기존처럼 워커마다 앱을 불러오므로 두 방식의 부팅 시간과 메모리를 비교할 수 있습니다.
+워커들은 METRICS_DIR에 지표 스냅샷 파일을 남기고, /metrics는 이를 합산합니다 (종료된 워커의 파일은 child_exit에서 삭제).
+"""
+import gc
+import os
+import tempfile
+import time
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+if preload_app:
+    # 마스터에서 스레드를 시작하지 않도록 앱에 알림 (스레드가 잡은 잠금이 fork로 복제되는 것을 방지)
+    os.environ["APP_DEFER_BACKGROUND_THREADS"] = "1"
+
+# 모든 워커가 같은 지표 디렉터리를 쓰도록 앱을 불러오기 전에 고정
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "music-taste-metrics"))
+
+def on_starting(server):
+    # 이전 실행의 워커 스냅샷이 새 카운터에 더해지지 않도록 비움
+    metrics_dir = os.environ["METRICS_DIR"]
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith("metrics-"):
+                os.remove(os.path.join(metrics_dir, name))
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import app
+    started = time.perf_counter()
+    app.warm_shared_state()
+    # 이후 GC가 공유 객체의 헤더를 건드려 페이지가 복사되지 않도록 현재 객체를 GC 대상에서 제외
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        "공유 데이터 준비 완료: %.1fms, 마스터 메모리 %s",
+        (time.perf_counter() - started) * 1000, app.process_memory()
+    )
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    if preload_app:
+        import app
+        app.start_background_threads()
+
+def post_worker_init(worker):
+    import app
+    if not preload_app:
+        # preload 모드에서는 마스터(when_ready)에서 이미 확인함. 사전이 없으면 워커 부팅 실패로 서버가 멈춤
+        app.require_sentiment_lexicon()
+    # fork부터 요청을 받을 준비가 될 때까지 걸린 시간 (preload를 끄면 앱 import 시간이 포함됨)
+    worker.log.info(
+        "워커 %s 준비 완료: %.1fms, 메모리 %s",
+        worker.pid, (time.perf_counter() - worker.forked_at) * 1000, app.process_memory()
+    )
+
+def child_exit(server, worker):
+    # 마스터에서 실행되므로 비정상 종료된 워커의 스냅샷도 지워, /metrics가 죽은 워커의 값을 계속 더하지 않게 함
+    metrics_dir = os.environ["METRICS_DIR"]
+    try:
+        os.remove(os.path.join(metrics_dir, f"metrics-{worker.pid}.json"))
+    except FileNotFoundError:
+        pass
@@ -259,26 +259,75 @@ $(document).ready(function () {
         $li.data("progressAnimationId", progressAnimationId);
     });
 
+    // 함수: 분류 결과를 저장하고 결과 페이지로 이동
+    function showResult(response) {
+        // 응답 받은 후 로딩 화면 숨기기
+        $("#loading-overlay").hide();
+
+        // 분석 데이터를 localStorage에 저장 (문자열 형태)
+        localStorage.setItem("analysisData", JSON.stringify(response.analysisData));
+
+        const resultUrl = `/result?group=${encodeURIComponent(response.group)}&explanation=${encodeURIComponent(response.explanation)}`;
+        window.location.href = resultUrl;
+    }
+
     // 함수: 선택한 곡 제출
     function submitSelectedTracks() {
         // 로딩 화면 보이기
+        $("#loading-progress").text("");
         $("#loading-overlay").show();
-        
+
+        // 진행 상황 스트림(SSE)을 지원하면 단계별 진행 상황을 표시, 아니면 일반 요청으로 분류
+        if (window.EventSource) {
+            submitWithProgress();
+        } else {
+            submitWithoutProgress();
+        }
+    }
+
+    // 함수: /mbti/stream으로 분류하며 트랙별 진행 상황 표시
+    function submitWithProgress() {
+        const total = selectedTrackIds.length;
+        const done = { metadata: 0, genres: 0, lyrics: 0 };
+        const labels = { metadata: "곡 정보 확인", genres: "장르 분석", lyrics: "가사 분석" };
+        let finished = false;
+
+        const source = new EventSource(`/mbti/stream?track_ids=${encodeURIComponent(selectedTrackIds.join(","))}`);
+        Object.keys(labels).forEach(function (stage) {
+            source.addEventListener(stage, function () {
+                done[stage] += 1;
+                $("#loading-progress").text(`${labels[stage]} 중... (${Math.min(done[stage], total)}/${total})`);
+            });
+        });
+        source.addEventListener("result", function (e) {
+            finished = true;
+            source.close();
+            const response = JSON.parse(e.data);
+            if (response.status !== 200) {
+                $("#loading-overlay").hide();
+                alert("MBTI 분류 중 오류가 발생했습니다. 다시 시도해주세요.");
+                return;
+            }
+            showResult(response);
+        });
+        // 스트림 연결에 실패하면 일반 요청으로 다시 시도
+        source.onerror = function () {
+            source.close();
+            if (!finished) {
+                finished = true;
+                submitWithoutProgress();
+            }
+        };
+    }
+
+    // 함수: /mbti에 한 번의 요청으로 분류
+    function submitWithoutProgress() {
         $.ajax({
             url: "/mbti",
             type: "POST",
             contentType: "application/json",
             data: JSON.stringify({ track_ids: selectedTrackIds }),
-            success: function (response) {
-                // 응답 받은 후 로딩 화면 숨기기
-                $("#loading-overlay").hide();
-
-                // 분석 데이터를 localStorage에 저장 (문자열 형태)
-                localStorage.setItem("analysisData", JSON.stringify(response.analysisData));
-
-                const resultUrl = `/result?group=${encodeURIComponent(response.group)}&explanation=${encodeURIComponent(response.explanation)}`;
-                window.location.href = resultUrl;
-            },
+            success: showResult,
             error: function () {
                 $("#loading-overlay").hide();
                 alert("MBTI 분류 중 오류가 발생했습니다. 다시 시도해주세요.");
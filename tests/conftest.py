@@ -0,0 +1,102 @@
+"""
+테스트 공통 설정.
+
+app.py는 불러오는 순간 캐시 DB, 토큰 캐시, 지표 디렉터리를 준비하고 백그라운드 스레드를 시작하므로,
+불러오기 전에 임시 경로와 가짜 자격 증명을 환경 변수로 지정하고 스레드는 시작하지 않게 합니다.
+Spotify/Genius 호출은 tests/fixtures/classification.json의 가짜 카탈로그로 대체합니다.
+"""
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+_tmp_dir = tempfile.mkdtemp(prefix="music-taste-tests-")
+os.environ.update({
+    "APP_CACHE_DB": os.path.join(_tmp_dir, "cache.sqlite3"),
+    "METRICS_DIR": os.path.join(_tmp_dir, "metrics"),
+    "SPOTIFY_TOKEN_CACHE_PATH": os.path.join(_tmp_dir, "spotify_token_cache"),
+    "LYRICS_CORPUS_DB": "",
+    "GENRE_SEEDS_PATH": os.path.join(ROOT, "genre_seeds.json"),
+    "APP_DEFER_BACKGROUND_THREADS": "1",
+})
+for name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "GENIUS_ACCESS_TOKEN"):
+    os.environ.setdefault(name, "test")
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402
+
+
+class FakeSpotify:
+    """카탈로그에 있는 트랙/아티스트만 돌려주는 spotipy.Spotify 대역 (없는 ID는 None)"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.calls = 0
+
+    def tracks(self, track_ids, market=None):
+        self.calls += 1
+        return {"tracks": [self.catalog["tracks"].get(tid) for tid in track_ids]}
+
+    def artists(self, artist_ids):
+        self.calls += 1
+        return {"artists": [self.catalog["artists"].get(aid) for aid in artist_ids]}
+
+    def search(self, q, limit=10, offset=0, type="track", market=None):
+        self.calls += 1
+        query = q.lower()
+        return {
+            "tracks": {"items": [t for t in self.catalog["tracks"].values() if query in t["name"].lower()][:limit]},
+            "artists": {"items": [a for a in self.catalog["artists"].values() if query in a["name"].lower()][:limit]},
+        }
+
+
+class FakeGenius:
+    """카탈로그의 (곡 제목, 아티스트) → 가사로 응답하는 lyricsgenius.Genius 대역 (가사가 없으면 None)"""
+
+    def __init__(self, catalog):
+        self.lyrics = {(title, artist): lyrics for title, artist, lyrics in catalog["lyrics"]}
+        self.calls = 0
+
+    def search_song(self, title, artist="", get_full_info=True):
+        self.calls += 1
+        lyrics = self.lyrics.get((title, artist))
+        if lyrics is None:
+            return None
+        return SimpleNamespace(lyrics=lyrics, _id=None, title=title, artist=artist)
+
+
+@pytest.fixture(scope="session")
+def app():
+    return app_module
+
+
+@pytest.fixture(scope="session")
+def catalog():
+    with open(os.path.join(FIXTURES, "classification.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def sentiment_engine(app):
+    try:
+        return app.get_sentiment_engine()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture
+def fake_upstream(app, catalog, sentiment_engine, monkeypatch):
+    """외부 API를 가짜 카탈로그로 바꾸고, 테스트끼리 영향을 주지 않도록 회로 차단기와 결과 캐시를 새로 만듦"""
+    upstream = SimpleNamespace(spotify=FakeSpotify(catalog), genius=FakeGenius(catalog))
+    monkeypatch.setattr(app, "sp", upstream.spotify)
+    monkeypatch.setattr(app, "genius", upstream.genius)
+    monkeypatch.setattr(app, "spotify_breaker", app.CircuitBreaker("spotify", 5, 30, 30))
+    monkeypatch.setattr(app, "genius_breaker", app.CircuitBreaker("genius", 5, 30, 30))
+    app.classification_cache.clear()
+    return upstream
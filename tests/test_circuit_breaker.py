@@ -0,0 +1,79 @@
+"""CircuitBreaker: 실패 판정, 열림/반열림 전환, 느린 호출 판정"""
+import threading
+import time
+
+import pytest
+from spotipy.exceptions import SpotifyException
+
+
+def raise_status(status):
+    def call():
+        raise SpotifyException(status, -1, f"HTTP {status}")
+    return call
+
+
+def fail_times(breaker, fn, times):
+    for _ in range(times):
+        with pytest.raises(Exception):
+            breaker.call(fn)
+
+
+@pytest.mark.parametrize("status", [400, 404])
+def test_bad_request_is_neutral(app, status):
+    breaker = app.CircuitBreaker("test", 3, 30, 5)
+    fail_times(breaker, raise_status(status), 10)
+    assert breaker.stats()["state"] == app.CircuitBreaker.CLOSED
+    assert breaker.stats()["failures"] == 0
+
+
+@pytest.mark.parametrize("status", [401, 403, 429, 500])
+def test_other_errors_open_at_threshold(app, status):
+    breaker = app.CircuitBreaker("test", 3, 30, 5)
+    fail_times(breaker, raise_status(status), 3)
+    assert breaker.stats()["state"] == app.CircuitBreaker.OPEN
+    with pytest.raises(app.CircuitOpenError):
+        breaker.call(lambda: "skipped")
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_trial_success_closes(app):
+    breaker = app.CircuitBreaker("test", 1, 0.05, 5)
+    fail_times(breaker, raise_status(500), 1)
+    time.sleep(0.06)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.stats()["state"] == app.CircuitBreaker.CLOSED
+
+
+def test_straggler_success_keeps_open(app):
+    # 차단기가 열리기 전에 시작해 늦게 성공한 호출이 열린 차단기를 닫지 않아야 함
+    breaker = app.CircuitBreaker("test", 2, 30, 5)
+    release = threading.Event()
+    straggler = threading.Thread(target=breaker.call, args=(release.wait,))
+    straggler.start()
+    time.sleep(0.02)
+    fail_times(breaker, raise_status(500), 2)
+    release.set()
+    straggler.join()
+    assert breaker.stats()["state"] == app.CircuitBreaker.OPEN
+
+
+def test_rate_limiter_wait_is_not_slow(app):
+    bucket = app.TokenBucket(10, 1)
+    breaker = app.CircuitBreaker("test", 1, 30, 0.05, rate_limiter=bucket)
+
+    def limited():
+        bucket.acquire()
+        return "ok"
+
+    for _ in range(3):
+        breaker.call(limited)
+    assert bucket.stats()["wait_seconds"] > 0.1
+    assert breaker.stats()["slow_calls"] == 0
+    assert breaker.stats()["state"] == app.CircuitBreaker.CLOSED
+
+
+def test_search_returns_503_when_open(app, fake_upstream):
+    app.spotify_breaker._transition(app.CircuitBreaker.OPEN)
+    response = app.app.test_client().get("/search?q=breaker-open-query")
+    assert response.status_code == 503
+    assert fake_upstream.spotify.calls == 0
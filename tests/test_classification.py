@@ -0,0 +1,26 @@
+"""
+분류 파이프라인 회귀 테스트.
+
+fixtures/classification.json의 expected는 분류를 배열 기반 파이프라인 단계로 나누기 전의
+트랙별 계산 구현이 같은 카탈로그와 선택 곡(cases)으로 만든 /mbti 응답입니다.
+"""
+import time
+
+
+def test_pipeline_matches_per_track_results(app, catalog, fake_upstream):
+    client = app.app.test_client()
+    for track_ids, (status, expected) in zip(catalog["cases"], catalog["expected"]):
+        response = client.post("/mbti", json={"track_ids": track_ids})
+        body = response.get_json()
+        # 가사 대체값 목록은 파이프라인 분리 이후에 추가된 필드
+        assert body.get("analysisData", {}).pop("lyrics_fallbacks", []) == []
+        assert (response.status_code, body) == (status, expected)
+
+
+def test_batch_matches_single_requests(app, catalog, fake_upstream):
+    deadline = time.monotonic() + 30
+    batch = app.classify_selections(catalog["cases"], lyrics_deadline=deadline)
+    app.classification_cache.clear()
+    single = [app.run_classification(track_ids) for track_ids in catalog["cases"]]
+    assert batch == single
+
@@ -0,0 +1,65 @@
+"""
+가사 전용 감성 엔진이 구간 표시를 남긴 원문 기준으로 NLTK VADER polarity_scores와 같은 compound 점수를 내는지 확인.
+
+fixtures/sentiment_regression.jsonl은 반복 후렴의 점수 합계가 0에 가까워 줄 단위로 합산하면 부호가 뒤집히던 사례로,
+`flask sentiment-benchmark tests/fixtures/sentiment_regression.jsonl`에도 그대로 넘길 수 있습니다.
+"""
+import json
+import os
+import random
+
+import pytest
+
+from conftest import FIXTURES
+
+TOLERANCE = 1e-4
+with open(os.path.join(FIXTURES, "sentiment_regression.jsonl"), encoding="utf-8") as f:
+    REGRESSION_LYRICS = [json.loads(line)["lyrics"] for line in f if line.strip()]
+
+
+@pytest.fixture
+def analyzer(app, sentiment_engine):
+    return app.get_sentiment_analyzer()
+
+
+def generated_lyrics(lexicon, count, seed):
+    """어휘 사전 단어, 부정어/강조어/구두점, 반복 후렴과 구간 표시를 섞은 가사를 재현 가능하게 생성"""
+    rng = random.Random(seed)
+    extra = [
+        "but", "BUT", "not", "NOT", "never", "very", "kind", "of", "without", "doubt", "at", "least", "no",
+        "sort", "so", "too", "really", "extremely", "nor", "aint", "isn't", "don't", "the", "a", "i", "I", "you",
+        "Love", "LOVE", "HATE", "(love)", "love!", "hate,", "'cause", "shit", "bomb", "hell", "yeah",
+        ":)", ":(", "!", "?", "...", ",", "!!", "??",
+    ]
+
+    def line():
+        words = (rng.choice(lexicon if rng.random() < 0.35 else extra) for _ in range(rng.randint(0, 9)))
+        return " ".join(words) + rng.choice(["", "!", "?", "!!", "...", ","])
+
+    for _ in range(count):
+        pool = [line() for _ in range(rng.randint(1, 6))]
+        lines = [
+            rng.choice(pool) if rng.random() < 0.8 else rng.choice(["[Chorus]", "[Verse 1: X]", ""])
+            for _ in range(rng.randint(1, 20))
+        ]
+        text = "\n".join(lines)
+        yield text.upper() if rng.random() < 0.3 else text
+
+
+@pytest.mark.parametrize("lyrics", REGRESSION_LYRICS)
+def test_regression_lyrics_match_nltk(sentiment_engine, analyzer, lyrics):
+    expected = analyzer.polarity_scores(lyrics)["compound"]
+    assert sentiment_engine.compound(lyrics, strip_sections=False) == pytest.approx(expected, abs=TOLERANCE)
+
+
+def test_generated_lyrics_match_nltk(sentiment_engine, analyzer):
+    for text in generated_lyrics(sorted(analyzer.lexicon), 500, seed=1):
+        expected = analyzer.polarity_scores(text)["compound"]
+        assert sentiment_engine.compound(text, strip_sections=False) == pytest.approx(expected, abs=TOLERANCE), text
+
+
+def test_stripped_sections_match_nltk_without_markers(sentiment_engine, analyzer):
+    text = "[Verse 1]\nI love you so much\n[Chorus]\nnever sad again!\n[Chorus]\nnever sad again!"
+    without_markers = "I love you so much\nnever sad again!\nnever sad again!"
+    expected = analyzer.polarity_scores(without_markers)["compound"]
+    assert sentiment_engine.compound(text) == pytest.approx(expected, abs=TOLERANCE)
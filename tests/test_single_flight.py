@@ -0,0 +1,95 @@
+"""SingleFlight: 같은 키의 동시 호출 합치기와 abandon()의 취소 경쟁 조건"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def test_do_many_fetches_each_key_once(app):
+    flight = app.SingleFlight()
+    fetched = []
+    started = threading.Barrier(8)
+
+    def fetch_many(keys):
+        fetched.extend(keys)
+        time.sleep(0.05)
+        return {key: key.upper() for key in keys}
+
+    def worker():
+        started.wait()
+        return flight.do_many(["a", "b", "a"], fetch_many)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = [f.result() for f in [executor.submit(worker) for _ in range(8)]]
+    assert all(result == {"a": "A", "b": "B"} for result in results)
+    assert sorted(fetched) == ["a", "b"]
+    assert flight.stats()["leaders"] == 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_do_propagates_exception_to_waiters(app):
+    flight = app.SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        entered.set()
+        release.wait()
+        raise ValueError("upstream")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flight.do, "k", failing)
+        entered.wait()
+        waiter = executor.submit(flight.do, "k", lambda: "unused")
+        while flight.stats()["shared"] == 0:
+            time.sleep(0.001)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(ValueError):
+                future.result(2)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_submit_joiner_never_receives_cancelled_future(app):
+    # 마지막 호출자가 abandon()으로 취소하는 도중에 같은 키로 합류하는 경우
+    flight = app.SingleFlight()
+    gate = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        executor.submit(gate.wait)  # 작업 스레드를 막아 다음 작업이 대기 상태로 남게 함
+        future = flight.submit("k", executor, lambda: "first")
+        cancel = future.cancel
+
+        def slow_cancel():
+            time.sleep(0.1)
+            return cancel()
+
+        future.cancel = slow_cancel
+        abandoning = threading.Thread(target=flight.abandon, args=("k", future))
+        abandoning.start()
+        time.sleep(0.02)
+        joined = flight.submit("k", executor, lambda: "second")
+        abandoning.join()
+        gate.set()
+        assert not joined.cancelled()
+        assert joined.result(2) == "second"
+
+
+def test_abandon_keeps_running_future_joinable(app):
+    flight = app.SingleFlight()
+    running = threading.Event()
+    release = threading.Event()
+
+    def work():
+        running.set()
+        release.wait()
+        return "done"
+
+    with ThreadPoolExecutor(1) as executor:
+        future = flight.submit("k", executor, work)
+        running.wait()
+        flight.abandon("k", future)
+        joined = flight.submit("k", executor, lambda: "unused")
+        release.set()
+        assert joined is future
+        assert joined.result(2) == "done"